@@ -0,0 +1,146 @@
+"""Benchmark link_parser.extract_all_links and diff against golden output
+
+    python -m benchmarks.bench_link_parser                      # default corpora
+    python -m benchmarks.bench_link_parser --lines 1000000 --no-golden
+    python -m benchmarks.bench_link_parser --write-golden       # after an intended change
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.gen_links import generate, encode
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+
+# (format, lines, encoding) corpora that have golden output checked in
+GOLDEN_CORPORA = [
+    ('txt', 2000, 'utf-8'),
+    ('txt', 2000, 'utf-8-sig'),
+    ('html', 2000, 'utf-8'),
+]
+
+def golden_path(fmt, lines, encoding, seed):
+    return os.path.join(GOLDEN_DIR, f"links_{fmt}_{lines}_{encoding}_s{seed}.json")
+
+def load_corpus(fmt, lines, encoding, seed, crlf=False):
+    """Generate a corpus and decode it the same way bot.handle_file does"""
+    raw = encode(generate(fmt, lines, seed, crlf), encoding)
+    return raw.decode('utf-8', errors='ignore')
+
+def extracted_rows(links):
+    return [[link['url'], link['type'], link['caption'], bool(link.get('ambiguous'))] for link in links]
+
+def measure(content, repeat=1):
+    from link_parser import extract_all_links
+
+    best = None
+    links = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        links = extract_all_links(content)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    extract_all_links(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return links, best, peak
+
+def diff_rows(expected, actual):
+    expected_set = {tuple(row) for row in expected}
+    actual_set = {tuple(row) for row in actual}
+    return {
+        'missing': sorted(expected_set - actual_set),
+        'extra': sorted(actual_set - expected_set),
+        'order_changed': expected_set == actual_set and expected != actual,
+    }
+
+def run_corpus(fmt, lines, encoding, seed, args):
+    content = load_corpus(fmt, lines, encoding, seed, args.crlf)
+    links, elapsed, peak = measure(content, args.repeat)
+    rows = extracted_rows(links)
+    report = {
+        'corpus': f"{fmt}/{lines}/{encoding}",
+        'lines': lines,
+        'links': len(rows),
+        'seconds': round(elapsed, 4),
+        'lines_per_s': round(lines / elapsed) if elapsed else None,
+        'peak_mem_bytes': peak,
+    }
+
+    path = golden_path(fmt, lines, encoding, seed)
+    if args.write_golden:
+        os.makedirs(GOLDEN_DIR, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            # One row per line keeps golden diffs reviewable
+            f.write('[\n' + ',\n'.join(json.dumps(row, ensure_ascii=False) for row in rows) + '\n]\n')
+        report['golden'] = 'written'
+    elif not args.no_golden and os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            expected = json.load(f)
+        diff = diff_rows(expected, rows)
+        report['golden'] = 'match' if not any(diff.values()) else 'DIFF'
+        report['missing'] = len(diff['missing'])
+        report['extra'] = len(diff['extra'])
+        report['order_changed'] = diff['order_changed']
+        for row in diff['missing'][:args.show]:
+            print(f"  - {row}")
+        for row in diff['extra'][:args.show]:
+            print(f"  + {row}")
+    else:
+        report['golden'] = 'none'
+
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--format', choices=['txt', 'html'])
+    parser.add_argument('--lines', type=int)
+    parser.add_argument('--encoding', default='utf-8')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--crlf', action='store_true')
+    parser.add_argument('--repeat', type=int, default=3, help='timing runs; the best is reported')
+    parser.add_argument('--write-golden', action='store_true', help='overwrite golden output with current results')
+    parser.add_argument('--no-golden', action='store_true', help='skip the golden comparison')
+    parser.add_argument('--show', type=int, default=5, help='diff rows to print per side')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    # Per-link debug logging would dominate the timings
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.format or args.lines:
+        corpora = [(args.format or 'txt', args.lines or 10000, args.encoding)]
+    else:
+        corpora = GOLDEN_CORPORA
+
+    reports = [run_corpus(fmt, lines, encoding, args.seed, args) for fmt, lines, encoding in corpora]
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        for r in reports:
+            line = (
+                f"{r['corpus']:<24} {r['links']:>7} links  {r['seconds']:>8.3f}s  "
+                f"{r['lines_per_s']:>9} lines/s  peak {r['peak_mem_bytes'] / 1024 / 1024:.1f} MB  "
+                f"golden: {r['golden']}"
+            )
+            if r['golden'] == 'DIFF':
+                line += f" (-{r['missing']} +{r['extra']}{', order' if r['order_changed'] else ''})"
+            print(line)
+
+    if any(r['golden'] == 'DIFF' for r in reports):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
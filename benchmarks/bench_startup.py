@@ -0,0 +1,123 @@
+"""Cold-start benchmark: import cost and time to first reply
+
+Reports `python -X importtime` totals for `import bot` and the heavy
+dependencies, then launches `python bot.py` in polling mode against the fake
+Bot API with a /start already waiting and measures how long the first reply
+and a healthy /health take:
+
+    python -m benchmarks.bench_startup --runs 5
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.fake_bot_api import FakeBotAPI, message_update
+from traces import percentile
+
+USER_ID = 4242
+HEAVY_MODULES = ('telegram', 'aiohttp', 'yt_dlp', 'bs4', 'motor', 'pymongo')
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def import_times():
+    """Cumulative import time in ms per module for `import bot` in a fresh interpreter"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import bot'],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times.setdefault(name.strip(), int(cumulative) / 1000)
+    return times
+
+async def wait_healthy(session, url, deadline):
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return True
+        except Exception:
+            pass
+        await asyncio.sleep(0.01)
+    return False
+
+async def cold_start(timeout):
+    """Seconds from spawning bot.py to the first sendMessage and to /health answering"""
+    import aiohttp
+
+    api = FakeBotAPI()
+    await api.start()
+    # Telegram holds the update that woke the service until the bot polls
+    api.add_update(message_update(1, USER_ID, USER_ID, '/start'))
+
+    port = free_port()
+    env = dict(os.environ)
+    env.pop('MONGODB_URI', None)
+    env.pop('WEBHOOK_URL', None)
+    env.update(
+        BOT_TOKEN='123456:BENCH',
+        BOT_API_URL=api.base_url,
+        AUTHORIZED_USER_ID=str(USER_ID),
+        PORT=str(port),
+        YTDL_WORKERS='0',
+    )
+
+    started = time.monotonic()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, 'bot.py', cwd=REPO_ROOT, env=env,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+    )
+    try:
+        await api.wait_for_call('sendMessage', 1, timeout)
+        first_reply = time.monotonic() - started
+        async with aiohttp.ClientSession() as session:
+            healthy = await wait_healthy(session, f"http://127.0.0.1:{port}/health", started + timeout)
+        health = time.monotonic() - started if healthy else None
+    finally:
+        process.terminate()
+        await process.wait()
+        await api.stop()
+    return first_reply, health
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=30)
+    args = parser.parse_args()
+
+    times = import_times()
+    print(f"import bot:       {times.get('bot', 0):.1f} ms")
+    for name in HEAVY_MODULES:
+        value = times.get(name)
+        print(f"  {name:<15} {f'{value:.1f} ms' if value is not None else 'not imported'}")
+
+    replies, healths = [], []
+    for _ in range(args.runs):
+        first_reply, health = asyncio.run(cold_start(args.timeout))
+        replies.append(first_reply * 1000)
+        if health is not None:
+            healths.append(health * 1000)
+
+    print(f"Runs:             {args.runs}")
+    print(f"First reply p50:  {percentile(replies, 50):.0f} ms (max {max(replies):.0f} ms)")
+    if healths:
+        print(f"/health p50:      {percentile(healths, 50):.0f} ms (max {max(healths):.0f} ms)")
+    else:
+        print("/health:          never answered")
+
+if __name__ == '__main__':
+    main()
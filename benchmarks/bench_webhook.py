@@ -0,0 +1,86 @@
+"""Webhook round-trip benchmark against a fake Telegram
+
+Runs the bot in webhook mode against the fake Bot API, posts command updates
+to the webhook like Telegram would and measures update-to-reply latency:
+
+    python -m benchmarks.bench_webhook --updates 200
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.fake_bot_api import FakeBotAPI, message_update, post_update
+from traces import percentile
+
+USER_ID = 4242
+SECRET = 'bench-secret'
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+async def run(args):
+    import aiohttp
+
+    port = free_port()
+    os.environ['PORT'] = str(port)
+    os.environ['WEBHOOK_SECRET'] = SECRET
+    os.environ['AUTHORIZED_USER_ID'] = str(USER_ID)
+
+    import bot as bot_module
+    from traces import TraceStore
+    bot_module.trace_store = TraceStore(None)
+
+    api = FakeBotAPI()
+    await api.start()
+
+    application = bot_module.build_application('123456:BENCH', api.base_url)
+    stop_event = asyncio.Event()
+    server = asyncio.create_task(bot_module.run_webhook(application, f"http://127.0.0.1:{port}", stop_event))
+
+    webhook = f"http://127.0.0.1:{port}{bot_module.WEBHOOK_PATH}"
+    latencies = []
+    try:
+        await api.wait_for_call('setWebhook', 1)
+        async with aiohttp.ClientSession() as session:
+            # A wrong secret must be rejected before anything reaches the bot
+            assert await post_update(session, webhook, message_update(1, USER_ID, USER_ID, '/start'), 'wrong') == 403
+
+            for i in range(args.updates):
+                # /start and /cancel alternate so every update gets exactly one reply
+                text = '/start' if i % 2 == 0 else '/cancel'
+                expected = api.calls.get('sendMessage', 0) + 1
+                started = time.perf_counter()
+                status = await post_update(session, webhook, message_update(i + 2, USER_ID, USER_ID, text), SECRET)
+                assert status == 200, status
+                await api.wait_for_call('sendMessage', expected)
+                latencies.append(time.perf_counter() - started)
+    finally:
+        stop_event.set()
+        await server
+        await api.stop()
+
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=100)
+    args = parser.parse_args()
+
+    latencies = asyncio.run(run(args))
+    ms = [value * 1000 for value in latencies]
+    print(f"Updates:   {len(ms)}")
+    print(f"p50:       {percentile(ms, 50):.2f} ms")
+    print(f"p95:       {percentile(ms, 95):.2f} ms")
+    print(f"max:       {max(ms):.2f} ms")
+
+if __name__ == '__main__':
+    main()
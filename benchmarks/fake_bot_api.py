@@ -0,0 +1,185 @@
+import json
+import time
+import asyncio
+import logging
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_METHODS = ('sendVideo', 'sendDocument', 'sendMediaGroup')
+BOT_USER = {'id': 1000, 'is_bot': True, 'first_name': 'BenchBot', 'username': 'bench_bot'}
+
+class FakeBotAPI:
+    """Minimal Telegram Bot API endpoint that accepts uploads and records calls"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, flood_every=0, flood_retry_after=1):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.flood_every = flood_every
+        self.flood_retry_after = flood_retry_after
+        self.floods_sent = 0
+        self._upload_calls = 0
+        self.calls = {}
+        self.bytes_received = 0
+        self.files_received = 0
+        self._message_id = 0
+        self.updates = []
+        self._runner = None
+        self._changed = asyncio.Condition()
+
+    @property
+    def base_url(self):
+        """Value for Bot(base_url=...); the token is appended by the client"""
+        return f"http://{self.host}:{self.port}/bot"
+
+    async def start(self):
+        app = web.Application(client_max_size=4 * 1024 * 1024 * 1024)
+        app.router.add_post('/bot{token}/{method}', self._dispatch)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        logger.info(f"Fake Bot API listening on {self.base_url}")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def wait_for_call(self, method, count, timeout=30):
+        """Wait until method has been called at least count times"""
+        async with self._changed:
+            await asyncio.wait_for(
+                self._changed.wait_for(lambda: self.calls.get(method, 0) >= count),
+                timeout
+            )
+
+    async def _dispatch(self, request):
+        method = request.match_info['method']
+        self.calls[method] = self.calls.get(method, 0) + 1
+        async with self._changed:
+            self._changed.notify_all()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        # Answer every Nth upload with a 429 to exercise flood-wait handling
+        if self.flood_every and method in UPLOAD_METHODS:
+            self._upload_calls += 1
+            if self._upload_calls % self.flood_every == 0:
+                self.floods_sent += 1
+                return web.json_response({
+                    'ok': False,
+                    'error_code': 429,
+                    'description': f'Too Many Requests: retry after {self.flood_retry_after}',
+                    'parameters': {'retry_after': self.flood_retry_after},
+                }, status=429)
+
+        params = await self._read_params(request)
+        handler = getattr(self, f'_api_{method}', None)
+        if handler is None:
+            return _ok(True)
+        result = handler(params)
+        if asyncio.iscoroutine(result):
+            result = await result
+        return _ok(result)
+
+    async def _read_params(self, request):
+        if request.content_type == 'application/json':
+            return await request.json()
+
+        params = {}
+        form = await request.post()
+        for key, value in form.items():
+            if isinstance(value, web.FileField):
+                data = value.file.read()
+                self.bytes_received += len(data)
+                self.files_received += 1
+                params[key] = {'filename': value.filename, 'size': len(data)}
+            else:
+                params[key] = value
+        return params
+
+    def _next_message(self, params, **extra):
+        self._message_id += 1
+        chat_id = int(params.get('chat_id', 0) or 0)
+        message = {
+            'message_id': self._message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+        }
+        message.update(extra)
+        return message
+
+    def add_update(self, update):
+        """Queue an update for the bot's next getUpdates call"""
+        self.updates.append(update)
+
+    def _api_getMe(self, params):
+        return BOT_USER
+
+    async def _api_getUpdates(self, params):
+        offset = int(params.get('offset', 0) or 0)
+        # Long poll, but briefly, so a stopping bot is not held up
+        deadline = time.monotonic() + min(float(params.get('timeout', 0) or 0), 1.0)
+        while True:
+            pending = [update for update in self.updates if update['update_id'] >= offset]
+            if pending or time.monotonic() >= deadline:
+                return pending
+            await asyncio.sleep(0.02)
+
+    def _api_sendMessage(self, params):
+        return self._next_message(params, text=params.get('text', ''))
+
+    def _api_editMessageText(self, params):
+        message = self._next_message(params, text=params.get('text', ''))
+        message['message_id'] = int(params.get('message_id', 0) or 0)
+        return message
+
+    def _api_sendVideo(self, params):
+        file_ref = self._file_ref('video')
+        return self._next_message(params, video={
+            **file_ref, 'width': 640, 'height': 360, 'duration': 1
+        }, caption=params.get('caption'))
+
+    def _api_sendDocument(self, params):
+        return self._next_message(params, document=self._file_ref('document'), caption=params.get('caption'))
+
+    def _api_sendMediaGroup(self, params):
+        media = params.get('media') or '[]'
+        if isinstance(media, str):
+            media = json.loads(media)
+        messages = []
+        for entry in media:
+            kind = entry.get('type', 'document')
+            key = 'video' if kind == 'video' else 'document'
+            messages.append(self._next_message(params, **{key: self._file_ref(key)}, caption=entry.get('caption')))
+        return messages
+
+    def _file_ref(self, kind):
+        return {'file_id': f'{kind}_{self._message_id + 1}', 'file_unique_id': f'u{self._message_id + 1}'}
+
+def message_update(update_id, user_id, chat_id, text):
+    """Telegram Update payload for a private text message"""
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Bench'},
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+            if text.startswith('/') else [],
+        },
+    }
+
+async def post_update(session, url, update, secret_token=None):
+    """Deliver an update to a webhook the way Telegram does"""
+    headers = {'X-Telegram-Bot-Api-Secret-Token': secret_token} if secret_token else {}
+    async with session.post(url, json=update, headers=headers) as response:
+        return response.status
+
+def _ok(result):
+    return web.json_response({'ok': True, 'result': result})
@@ -0,0 +1,170 @@
+"""Synthetic TXT/HTML link-file generator for parser benchmarks
+
+    python -m benchmarks.gen_links --format txt --lines 100000 -o links.txt
+"""
+import re
+import random
+import argparse
+import html as html_lib
+from urllib.parse import quote
+
+VIDEO_HOSTS = [
+    'd1a2b3c4.cloudfront.net', 'media-prod.s3.ap-south-1.amazonaws.com', 'cdn.hranker.com',
+    'stream.selectionway.com', 'www.youtube.com', 'youtu.be', 'player.vimeo.com', 'vod.example-cdn.net',
+]
+PDF_HOSTS = [
+    'notes.example.org', 'storage.googleapis.com', 'files.coachingapp.in', 'www.example.com',
+]
+# Extensionless shapes the classifier cannot settle; they must come out ambiguous, not dropped
+BARE_VIDEO_URLS = [
+    'https://bucket.s3.amazonaws.com/{token}', 'https://s3.ap-south-1.amazonaws.com/bucket/lec{n}',
+    'https://abc.cloudflare.com/{token}', 'https://example.com/media/{token}',
+]
+NOISE_HOSTS = ['t.me', 'instagram.com', 'www.google.com', 'example.com']
+SUBJECTS = ['English', 'Maths', 'Reasoning', 'GK', 'Physics', 'Chemistry', 'इतिहास', 'भूगोल', 'Polity']
+NOISE_LINES = [
+    'Join our channel for more updates',
+    '=====================================',
+    '📚 Batch 2024 complete course 📚',
+    'Note: links expire after 24 hours',
+    'Contact admin for access',
+    '',
+]
+
+def _token(rng, length=32):
+    return ''.join(rng.choice('abcdef0123456789') for _ in range(length))
+
+def _signature(rng, host):
+    """Signed query string in the style the host uses"""
+    expires = rng.randint(10**9, 2 * 10**9)
+    if host.endswith('cloudfront.net'):
+        return f"Expires={expires}&Signature={_token(rng)}&Key-Pair-Id=K2JCJMDEHXQW5F"
+    if host.endswith('amazonaws.com'):
+        return f"X-Amz-Expires=3600&X-Amz-Signature={_token(rng)}"
+    # Unknown hosts: token may identify the file, so canonicalization keeps it
+    return f"token={_token(rng)}&expires={expires}"
+
+def _video_url(rng, n):
+    host = rng.choice(VIDEO_HOSTS)
+    kind = rng.random()
+    if 'youtu' in host:
+        return f"https://{host}/watch?v={_token(rng, 11)}"
+    if kind < 0.4:
+        return f"https://{host}/hls/{n}/master.m3u8?{_signature(rng, host)}"
+    if kind < 0.7:
+        return f"https://{host}/videos/lecture_{n}.mp4"
+    if kind < 0.9:
+        return f"https://{host}/embed/{_token(rng, 12)}"
+    return rng.choice(BARE_VIDEO_URLS).format(token=_token(rng, 12), n=n)
+
+def _pdf_url(rng, n):
+    host = rng.choice(PDF_HOSTS)
+    name = rng.choice(['notes', 'Class Notes', 'DPP', 'प्रश्न'])
+    if rng.random() < 0.3:
+        name = quote(name)
+    return f"https://{host}/pdfs/{name}_{n}.pdf"
+
+def _noise_url(rng):
+    return f"https://{rng.choice(NOISE_HOSTS)}/{_token(rng, 8)}"
+
+def _decorate(rng, url):
+    """Apply the formatting quirks seen in real exported link files"""
+    roll = rng.random()
+    if roll < 0.05:
+        return url.replace('&', '&amp;')
+    if roll < 0.08 and url.startswith('https://www.'):
+        return url[len('https://'):]
+    if roll < 0.11:
+        return url + rng.choice(['.', ',', ')', ';'])
+    return url
+
+def _resign(rng, url):
+    """Same link with a fresh token and expiry, as when a batch is re-exported"""
+    url = re.sub(r'(token|Signature)=[0-9a-f]+', lambda m: f"{m.group(1)}={_token(rng)}", url)
+    return re.sub(r'(expires|Expires)=\d+', lambda m: f"{m.group(1)}={rng.randint(10**9, 2 * 10**9)}", url)
+
+def generate_items(lines, seed=1, duplicate_rate=0.05, resign_rate=0.5):
+    """Yield (caption, url) pairs, or (text, None) for noise lines
+
+    Duplicates repeat an earlier pair; resign_rate of them get a new signature.
+    On known signing hosts canonicalization folds those back into one link;
+    token= links on other hosts stay separate.
+    """
+    rng = random.Random(seed)
+    # Separate stream so re-signing does not shift the rest of the corpus
+    resign_rng = random.Random(seed + 2)
+    seen = []
+    for n in range(lines):
+        roll = rng.random()
+        if roll < 0.08:
+            yield rng.choice(NOISE_LINES), None
+            continue
+        if seen and rng.random() < duplicate_rate:
+            caption, url = rng.choice(seen)
+            if resign_rng.random() < resign_rate:
+                url = _resign(resign_rng, url)
+            yield caption, url
+            continue
+        subject = rng.choice(SUBJECTS)
+        if roll < 0.12:
+            caption, url = f"{subject} reference", _noise_url(rng)
+        elif roll < 0.45:
+            caption, url = f"{subject} Notes {n}", _pdf_url(rng, n)
+        else:
+            caption, url = f"{subject} Class {n}", _video_url(rng, n)
+        url = _decorate(rng, url)
+        seen.append((caption, url))
+        if len(seen) > 1000:
+            seen.pop(0)
+        yield caption, url
+
+def generate_txt(lines, seed=1, crlf=False):
+    rng = random.Random(seed + 1)
+    out = []
+    for caption, url in generate_items(lines, seed):
+        if url is None:
+            out.append(caption)
+        elif rng.random() < 0.1:
+            out.append(f"{caption} - {url} | mirror: {url}")
+        else:
+            out.append(f"{caption}: {url}")
+    newline = '\r\n' if crlf else '\n'
+    return newline.join(out) + newline
+
+def generate_html(lines, seed=1):
+    out = ['<html><head><meta charset="utf-8"><title>Batch</title></head><body>']
+    for caption, url in generate_items(lines, seed):
+        if url is None:
+            out.append(f'<p>{html_lib.escape(caption)}</p>')
+        else:
+            href = url if '&amp;' in url else html_lib.escape(url, quote=True)
+            out.append(f'<div class="item"><a href="{href}">{html_lib.escape(caption)}</a></div>')
+    out.append('</body></html>')
+    return '\n'.join(out) + '\n'
+
+def generate(fmt, lines, seed=1, crlf=False):
+    if fmt == 'html':
+        return generate_html(lines, seed)
+    return generate_txt(lines, seed, crlf)
+
+def encode(content, encoding):
+    """Encode like the files users upload; utf-8-sig adds a BOM"""
+    return content.encode(encoding, errors='replace')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--format', choices=['txt', 'html'], default='txt')
+    parser.add_argument('--lines', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--crlf', action='store_true', help='use Windows line endings (txt only)')
+    parser.add_argument('--encoding', default='utf-8', help='utf-8, utf-8-sig, utf-16, latin-1, ...')
+    parser.add_argument('-o', '--output', required=True)
+    args = parser.parse_args()
+
+    content = generate(args.format, args.lines, args.seed, args.crlf)
+    with open(args.output, 'wb') as f:
+        f.write(encode(content, args.encoding))
+    print(f"Wrote {args.lines} lines to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+import os
+import re
+import zlib
+import random
+import shutil
+import asyncio
+import logging
+import subprocess
+import tempfile
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+TS_PACKET = 188
+HLS_KEY = bytes(range(16))
+PDF_HEADER = b'%PDF-1.4\n1 0 obj << /Type /Catalog >> endobj\n'
+
+class MediaServer:
+    """Local media server with synthetic MP4, PDF and AES-128 HLS content
+
+    latency is added before every response, bandwidth (bytes/s, 0 = unlimited)
+    throttles response bodies and Range requests can be switched off to mimic
+    CDNs without partial content support.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, bandwidth=0,
+                 range_support=True, video_size=8 * 1024 * 1024, pdf_size=2 * 1024 * 1024,
+                 hls_segments=6, seed=1, distinct=True):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.range_support = range_support
+        self.video_size = video_size
+        self.pdf_size = pdf_size
+        self.hls_segments = hls_segments
+        self.random = random.Random(seed)
+        # Serve different bytes per name so content dedup does not collapse a batch
+        self.distinct = distinct
+        self.bytes_sent = 0
+        self.requests = 0
+        self._runner = None
+        self._payloads = {}
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def video_url(self, name):
+        return f"{self.base_url}/video/{name}.mp4"
+
+    def pdf_url(self, name):
+        return f"{self.base_url}/pdf/{name}.pdf"
+
+    def hls_url(self, name):
+        return f"{self.base_url}/hls/{name}/index.m3u8"
+
+    async def start(self):
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self._build_payloads)
+
+        app = web.Application()
+        app.router.add_get('/video/{name}.mp4', self._video)
+        app.router.add_get('/pdf/{name}.pdf', self._pdf)
+        app.router.add_get('/hls/{name}/index.m3u8', self._playlist)
+        app.router.add_get('/hls/{name}/key.bin', self._key)
+        app.router.add_get('/hls/{name}/seg{num}.ts', self._segment)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        logger.info(f"Media server listening on {self.base_url}")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def _build_payloads(self):
+        self._payloads['video'] = _synthetic_video(self.video_size, 'mp4', self.random)
+        self._payloads['pdf'] = _synthetic_pdf(self.pdf_size, self.random)
+
+        stream = _synthetic_video(self.video_size, 'mpegts', self.random)
+        stream = stream[:len(stream) - len(stream) % TS_PACKET]
+        packets = len(stream) // TS_PACKET
+        per_segment = max(1, packets // self.hls_segments)
+        segments = []
+        for i in range(self.hls_segments):
+            start = i * per_segment * TS_PACKET
+            end = len(stream) if i == self.hls_segments - 1 else start + per_segment * TS_PACKET
+            segments.append(_encrypt_segment(stream[start:end], i))
+        self._payloads['segments'] = segments
+
+    async def _video(self, request):
+        body = self._payloads['video']
+        if self.distinct:
+            # Trailing padding keeps the container playable and makes sizes differ per name
+            name = request.match_info['name'].encode()
+            body = body + bytes(1 + zlib.crc32(name) % 4093)
+        return await self._send(request, body, 'video/mp4')
+
+    async def _pdf(self, request):
+        body = self._payloads['pdf']
+        if self.distinct:
+            # Stamp the name into the comment right after the header, inside the fingerprinted prefix
+            stamp = request.match_info['name'].encode()[:32].ljust(32)
+            offset = len(PDF_HEADER) + 1
+            body = body[:offset] + stamp + body[offset + len(stamp):]
+        return await self._send(request, body, 'application/pdf')
+
+    async def _playlist(self, request):
+        lines = [
+            '#EXTM3U',
+            '#EXT-X-VERSION:3',
+            '#EXT-X-TARGETDURATION:2',
+            '#EXT-X-MEDIA-SEQUENCE:0',
+            '#EXT-X-KEY:METHOD=AES-128,URI="key.bin"',
+        ]
+        for i in range(len(self._payloads['segments'])):
+            lines.append('#EXTINF:2.0,')
+            lines.append(f'seg{i}.ts')
+        lines.append('#EXT-X-ENDLIST')
+        body = ('\n'.join(lines) + '\n').encode()
+        return await self._send(request, body, 'application/vnd.apple.mpegurl')
+
+    async def _key(self, request):
+        return await self._send(request, HLS_KEY, 'application/octet-stream')
+
+    async def _segment(self, request):
+        num = int(request.match_info['num'])
+        segments = self._payloads['segments']
+        if num >= len(segments):
+            raise web.HTTPNotFound()
+        return await self._send(request, segments[num], 'video/mp2t')
+
+    async def _send(self, request, body, content_type):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        status = 200
+        start, end = 0, len(body) - 1
+        headers = {'Content-Type': content_type}
+
+        range_header = request.headers.get('Range')
+        if self.range_support:
+            headers['Accept-Ranges'] = 'bytes'
+            match = re.match(r'bytes=(\d*)-(\d*)', range_header or '')
+            if match and (match.group(1) or match.group(2)):
+                if match.group(1):
+                    start = int(match.group(1))
+                    end = int(match.group(2)) if match.group(2) else len(body) - 1
+                else:
+                    start = max(0, len(body) - int(match.group(2)))
+                end = min(end, len(body) - 1)
+                if start > end:
+                    raise web.HTTPRequestRangeNotSatisfiable(headers={'Content-Range': f'bytes */{len(body)}'})
+                status = 206
+                headers['Content-Range'] = f'bytes {start}-{end}/{len(body)}'
+
+        response = web.StreamResponse(status=status, headers=headers)
+        response.content_length = end - start + 1
+        await response.prepare(request)
+
+        view = memoryview(body)[start:end + 1]
+        chunk_size = 64 * 1024
+        for offset in range(0, len(view), chunk_size):
+            chunk = view[offset:offset + chunk_size]
+            await response.write(bytes(chunk))
+            self.bytes_sent += len(chunk)
+            if self.bandwidth:
+                await asyncio.sleep(len(chunk) / self.bandwidth)
+
+        await response.write_eof()
+        return response
+
+def _synthetic_video(size, container, rng):
+    """Real test-pattern video from ffmpeg when available, random bytes otherwise"""
+    if shutil.which('ffmpeg'):
+        # Roughly 1 MB per second of 640x360 testsrc at this bitrate
+        seconds = max(2, size // (1024 * 1024))
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, f'bench.{"ts" if container == "mpegts" else "mp4"}')
+            cmd = [
+                'ffmpeg', '-loglevel', 'error', '-y',
+                '-f', 'lavfi', '-i', f'testsrc=size=640x360:rate=25:duration={seconds}',
+                '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+                '-c:v', 'libx264', '-preset', 'ultrafast', '-b:v', '8M',
+                '-c:a', 'aac', '-shortest', '-f', container, out
+            ]
+            try:
+                subprocess.run(cmd, check=True, timeout=300)
+                with open(out, 'rb') as f:
+                    return f.read()
+            except Exception as e:
+                logger.warning(f"ffmpeg payload generation failed, using random bytes: {e}")
+    return rng.randbytes(size)
+
+def _synthetic_pdf(size, rng):
+    header = PDF_HEADER
+    trailer = b'\ntrailer << /Root 1 0 R >>\n%%EOF\n'
+    filler = max(0, size - len(header) - len(trailer))
+    return header + b'%' + rng.randbytes(filler)[:max(0, filler - 1)] + trailer
+
+def _encrypt_segment(data, sequence):
+    from Cryptodome.Cipher import AES
+
+    # Without an explicit IV, HLS uses the media sequence number as the IV
+    iv = sequence.to_bytes(16, 'big')
+    pad = 16 - len(data) % 16
+    cipher = AES.new(HLS_KEY, AES.MODE_CBC, iv)
+    return cipher.encrypt(data + bytes([pad]) * pad)
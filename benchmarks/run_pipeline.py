@@ -0,0 +1,181 @@
+"""Offline end-to-end benchmark of the batch pipeline
+
+Serves synthetic media from a local server, points the bot at a fake Bot API
+and runs handle_caption over N links. Run from the repository root:
+
+    python -m benchmarks.run_pipeline --items 20 --mix video=1,pdf=2,hls=1
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import resource
+import tempfile
+from types import SimpleNamespace
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.media_server import MediaServer
+from benchmarks.fake_bot_api import FakeBotAPI, message_update
+
+USER_ID = 4242
+CHAT_ID = 4242
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        mix[kind.strip()] = int(weight or 1)
+    return mix
+
+def build_link_file(media, items, mix):
+    """Write links in the bot's TXT format, cycling through the weighted mix"""
+    order = [kind for kind, weight in mix.items() for _ in range(weight)]
+    lines = []
+    for i in range(items):
+        kind = order[i % len(order)]
+        # The parser also picks up bare domains such as "item0.pdf" in a line; a
+        # two-character last word keeps file names from looking like one
+        name = f"item{i}_v1"
+        if kind == 'video':
+            url = media.video_url(name)
+        elif kind == 'hls':
+            url = media.hls_url(name)
+        else:
+            url = media.pdf_url(name)
+        lines.append(f"Bench {kind} {i}: {url}")
+    return '\n'.join(lines) + '\n'
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+async def sample_disk(path, state, interval=0.2):
+    while True:
+        state['peak_disk'] = max(state['peak_disk'], dir_size(path))
+        await asyncio.sleep(interval)
+
+def peak_rss_bytes():
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return own * 1024, children * 1024
+
+async def run(args):
+    import bot as bot_module
+    from telegram import Bot, Update
+    from link_parser import extract_all_links
+    from traces import TraceStore
+
+    # Keep traces in memory only; the benchmark must not depend on MongoDB
+    bot_module.trace_store = TraceStore(None)
+
+    media = MediaServer(
+        latency=args.latency,
+        bandwidth=args.bandwidth,
+        range_support=not args.no_range,
+        video_size=args.video_mb * 1024 * 1024,
+        pdf_size=args.pdf_mb * 1024 * 1024,
+        distinct=not args.same_content,
+    )
+    api = FakeBotAPI(latency=args.api_latency, flood_every=args.flood_every)
+    await media.start()
+    await api.start()
+
+    links = extract_all_links(build_link_file(media, args.items, parse_mix(args.mix)))
+    assert len(links) == args.items, f"expected {args.items} links, parsed {len(links)}"
+
+    bot = Bot(args.token, base_url=api.base_url)
+    disk_state = {'peak_disk': 0}
+    sampler = asyncio.create_task(sample_disk('downloads', disk_state))
+
+    try:
+        async with bot:
+            update = Update.de_json(message_update(1, USER_ID, CHAT_ID, '/skip'), bot)
+            context = SimpleNamespace(bot=bot)
+
+            # Later passes re-run the same batch, as a user retrying it would
+            passes = []
+            for _ in range(args.passes):
+                bot_module.user_sessions[USER_ID] = {'links': links}
+                started = time.monotonic()
+                await bot_module.handle_caption(update, context)
+                passes.append(time.monotonic() - started)
+            elapsed = passes[0]
+    finally:
+        sampler.cancel()
+        await api.stop()
+        await media.stop()
+
+    rss, child_rss = peak_rss_bytes()
+    uploads = api.calls.get('sendVideo', 0) + api.calls.get('sendDocument', 0) + api.calls.get('sendMediaGroup', 0)
+    return {
+        'items': len(links),
+        'elapsed_s': round(elapsed, 3),
+        'rerun_elapsed_s': [round(value, 3) for value in passes[1:]],
+        'items_per_min': round(len(links) / elapsed * 60, 2) if elapsed else None,
+        'download_bytes_per_s': round(media.bytes_sent / elapsed) if elapsed else None,
+        'upload_bytes_per_s': round(api.bytes_received / elapsed) if elapsed else None,
+        'bytes_downloaded': media.bytes_sent,
+        'bytes_uploaded': api.bytes_received,
+        'files_uploaded': api.files_received,
+        'upload_calls': uploads,
+        'api_calls': sum(api.calls.values()),
+        'api_calls_by_method': api.calls,
+        'flood_waits_injected': api.floods_sent,
+        'peak_rss_bytes': rss,
+        'peak_child_rss_bytes': child_rss,
+        'peak_disk_bytes': disk_state['peak_disk'],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=10)
+    parser.add_argument('--mix', default='video=1,pdf=1,hls=1', help='weighted kinds: video, pdf, hls')
+    parser.add_argument('--latency', type=float, default=0.0, help='media server latency per request (s)')
+    parser.add_argument('--bandwidth', type=int, default=0, help='media server bandwidth in bytes/s (0 = unlimited)')
+    parser.add_argument('--no-range', action='store_true', help='disable Range support on the media server')
+    parser.add_argument('--api-latency', type=float, default=0.0, help='fake Bot API latency per call (s)')
+    parser.add_argument('--flood-every', type=int, default=0, help='answer every Nth upload with a 429')
+    parser.add_argument('--video-mb', type=int, default=8)
+    parser.add_argument('--pdf-mb', type=int, default=2)
+    parser.add_argument('--same-content', action='store_true', help='serve identical bytes for every link of a kind')
+    parser.add_argument('--passes', type=int, default=1, help='run the batch this many times (re-runs hit the media cache)')
+    parser.add_argument('--token', default='123456:BENCH')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    # Work in a scratch directory so downloads/ never touches the checkout
+    workdir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    os.chdir(workdir)
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"Items:            {report['items']} in {report['elapsed_s']}s")
+    if report['rerun_elapsed_s']:
+        print(f"Re-runs:          {', '.join(f'{value}s' for value in report['rerun_elapsed_s'])}")
+    print(f"Throughput:       {report['items_per_min']} items/min")
+    print(f"Download rate:    {report['download_bytes_per_s']} B/s")
+    print(f"Upload rate:      {report['upload_bytes_per_s']} B/s")
+    print(f"Bot API calls:    {report['api_calls']} ({report['upload_calls']} uploads, {report['flood_waits_injected']} flood waits)")
+    print(f"Peak RSS:         {report['peak_rss_bytes']} B (children {report['peak_child_rss_bytes']} B)")
+    print(f"Peak disk:        {report['peak_disk_bytes']} B")
+
+if __name__ == '__main__':
+    main()
@@ -2,13 +2,20 @@ import os
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, ConversationHandler, CallbackQueryHandler
-from motor.motor_asyncio import AsyncIOMotorClient
+from telegram.error import BadRequest
 import asyncio
-from downloader import download_media
-from uploader import upload_media
+import time
+import signal
+import secrets
+from downloader import download_media, shutdown_workers, warm_workers, DownloadProgress
+from uploader import upload_media, upload_document_group, resend_file, GROUP_MAX_FILE_SIZE, MAX_GROUP_SIZE
 from link_parser import extract_all_links
-from http.server import HTTPServer, BaseHTTPRequestHandler
-import threading
+from media_probe import resolve_ambiguous
+from media_cache import cache as media_cache
+from disk_writer import media_exists, media_size
+from content_index import sent_file_id, index as content_index
+from metrics import QUEUE_DEPTH, ACTIVE_TASKS, ITEMS_PROCESSED
+from traces import ItemTrace, TraceStore, summarize
 
 logging.basicConfig(
     level=logging.INFO,
@@ -18,29 +25,138 @@ logger = logging.getLogger(__name__)
 
 WAITING_FILE, WAITING_CAPTION = range(2)
 
-try:
-    mongo_client = AsyncIOMotorClient(os.getenv('MONGODB_URI'))
-    db = mongo_client['media_bot']
-    logger.info("MongoDB connected successfully")
-except Exception as e:
-    logger.error(f"MongoDB connection failed: {e}")
-    db = None
-
-class HealthHandler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        self.send_response(200)
-        self.send_header('Content-type', 'text/plain')
-        self.end_headers()
-        self.wfile.write(b'Bot is running!')
-    
-    def log_message(self, format, *args):
-        pass
-
-def start_health_server():
+# MongoDB, the web server and yt-dlp workers are brought up after polling
+# starts; motor and aiohttp alone add noticeable time to a cold start
+mongo_client = None
+db = None
+trace_store = TraceStore(None)
+
+# Fail fast when MongoDB is unreachable instead of motor's default 30 s per operation
+MONGO_TIMEOUT_MS = int(os.getenv('MONGO_TIMEOUT_MS', 3000))
+
+# Trace saves and hash writes run off the item loop; references keep the tasks alive
+background_tasks = set()
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+def connect_database():
+    global mongo_client, db
+    if db is not None:
+        return db
+    uri = os.getenv('MONGODB_URI')
+    if not uri:
+        logger.warning("MONGODB_URI not set, traces will not be stored")
+        return None
+    try:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        mongo_client = AsyncIOMotorClient(
+            uri,
+            serverSelectionTimeoutMS=MONGO_TIMEOUT_MS,
+            connectTimeoutMS=MONGO_TIMEOUT_MS
+        )
+        db = mongo_client['media_bot']
+        trace_store.attach(db)
+        content_index.attach(db)
+        logger.info("MongoDB connected successfully")
+    except Exception as e:
+        logger.error(f"MongoDB connection failed: {e}")
+        db = None
+    return db
+
+async def setup_database():
+    await trace_store.setup()
+    await content_index.setup()
+
+WEBHOOK_PATH = '/telegram'
+
+# What to do with an item whose content was already delivered: 'resend' by file_id or 'skip'
+DUPLICATE_ACTION = os.getenv('DUPLICATE_ACTION', 'resend')
+
+def create_web_app(application, secret_token=None):
+    from server import build_web_app
+    
+    # Webhook route is only mounted when a secret is given (webhook mode)
+    return build_web_app(
+        application=application,
+        webhook_path=WEBHOOK_PATH if secret_token else None,
+        secret_token=secret_token,
+        files_cache=media_cache,
+        files_token=os.getenv('FILE_ROUTE_TOKEN')
+    )
+
+async def post_init(application: Application):
+    # Return straight away so polling (and the first /start) is not held up
+    application.bot_data['warm_up'] = asyncio.create_task(warm_up(application))
+
+async def warm_up(application: Application):
+    """Start the health/metrics server and load heavy modules in the background"""
+    from server import start_web_server
+    
+    started = time.monotonic()
+    try:
+        port = int(os.getenv('PORT', 8000))
+        application.bot_data['web_runner'] = await start_web_server(port, create_web_app(application))
+        
+        connect_database()
+        await setup_database()
+        
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, warm_imports)
+        warm_workers()
+        logger.info(f"Warm-up finished in {time.monotonic() - started:.2f}s")
+    except Exception as e:
+        logger.error(f"Warm-up error: {e}", exc_info=True)
+
+def warm_imports():
+    # Parsers used by the first file upload
+    import bs4
+    import aiohttp
+
+async def post_shutdown(application: Application):
+    from server import stop_web_server
+    
+    task = application.bot_data.get('warm_up')
+    if task and not task.done():
+        task.cancel()
+    await stop_web_server(application.bot_data.get('web_runner'))
+    shutdown_workers()
+
+async def run_webhook(application: Application, webhook_url, stop_event=None):
+    """Serve webhook updates, health and metrics from one server in the bot's loop"""
     port = int(os.getenv('PORT', 8000))
-    server = HTTPServer(('0.0.0.0', port), HealthHandler)
-    logger.info(f"Health server started on port {port}")
-    server.serve_forever()
+    secret_token = os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+    
+    if stop_event is None:
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+    
+    from server import start_web_server, stop_web_server
+    
+    async with application:
+        connect_database()
+        runner = await start_web_server(port, create_web_app(application, secret_token))
+        # Index and collection setup must not hold up binding the port
+        run_in_background(setup_database())
+        warm_workers()
+        try:
+            await application.bot.set_webhook(
+                url=webhook_url.rstrip('/') + WEBHOOK_PATH,
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES
+            )
+            await application.start()
+            logger.info(f"Webhook set to {webhook_url.rstrip('/')}{WEBHOOK_PATH}")
+            await stop_event.wait()
+            await application.stop()
+        finally:
+            await stop_web_server(runner)
+            shutdown_workers()
 
 user_sessions = {}
 stop_flags = {}
@@ -95,6 +211,12 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         links = extract_all_links(content)
         
+        # Links the classifier could not place are checked against the server's Content-Type
+        ambiguous = sum(1 for l in links if l.get('ambiguous'))
+        if ambiguous:
+            await status.edit_text(f"🔎 Checking {ambiguous} links...")
+            await resolve_ambiguous(links)
+        
         if not links:
             await status.edit_text("❌ No valid media links found in the file!")
             logger.warning(f"No links found in file from user {user_id}")
@@ -146,19 +268,45 @@ async def handle_caption(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     success = 0
     failed = 0
+    batch_id = f"{user_id}_{int(time.time())}"
+    
+    ACTIVE_TASKS.inc(kind='batch')
+    QUEUE_DEPTH.inc(len(links), queue='items')
+    
+    # Downloaded PDFs waiting to go out together as one album, sharing one status message
+    pending = []
+    group_progress = None
     
     for idx, item in enumerate(links, 1):
+        QUEUE_DEPTH.dec(queue='items')
+        
         if stop_flags.get(user_id, False):
+            QUEUE_DEPTH.dec(len(links) - idx, queue='items')
             await control_msg.edit_text("⏹️ **Process stopped by user**", parse_mode='Markdown')
             logger.info(f"User {user_id} stopped processing at item {idx}")
             break
         
+        # Keep delivery order: anything that is not a PDF flushes the group first
+        if pending and item['type'] != 'pdf':
+            sent = await send_pending_documents(pending, len(links), update.effective_chat.id, context.bot, group_progress)
+            success += sent
+            failed += len(pending) - sent
+            pending = []
+            group_progress = None
+        
+        ACTIVE_TASKS.inc(kind='item')
+        trace = ItemTrace(batch_id, idx, item['url'], item['type'])
+        result = 'error'
+        grouped = False
         try:
             caption = f"{item['caption']}\n\n{extra_caption}" if extra_caption else item['caption']
             
             logger.info(f"[{idx}/{len(links)}] Processing: {item['type']} - {item['url'][:100]}")
             
             # Download
+            if item['type'] == 'pdf' and group_progress is None:
+                group_progress = DownloadProgress(idx, len(links), update, context.bot, user_id, shared=True)
+            info = {'dedup': True}
             file_path = await download_media(
                 url=item['url'],
                 media_type=item['type'],
@@ -166,14 +314,94 @@ async def handle_caption(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 total=len(links),
                 update=update,
                 bot=context.bot,
-                user_id=user_id
+                user_id=user_id,
+                trace=trace,
+                info=info,
+                progress=group_progress if item['type'] == 'pdf' else None
             )
             
-            if not file_path or not os.path.exists(file_path):
+            # Same content may have been delivered before under another URL
+            duplicate = info.get('duplicate')
+            if duplicate is None and file_path:
+                duplicate = await content_index.find(item['type'], info.get('sha256'), info.get('prefix'), info.get('size'))
+            
+            if duplicate:
+                if pending:
+                    sent = await send_pending_documents(pending, len(links), update.effective_chat.id, context.bot, group_progress)
+                    success += sent
+                    failed += len(pending) - sent
+                    pending = []
+                    group_progress = None
+                
+                outcome = await deliver_duplicate(duplicate, caption, update.effective_chat.id, context.bot, trace)
+                if outcome != 'rejected':
+                    if file_path:
+                        media_cache.release(file_path)
+                    sent = outcome == 'sent'
+                    if group_progress:
+                        # Nothing pending, so no album will take the shared status over
+                        text = f"♻️ **Already delivered [{idx}/{len(links)}]**" if sent else \
+                            f"❌ **Re-send failed [{idx}/{len(links)}]**"
+                        await group_progress.finish(success=sent, text=text)
+                        group_progress = None
+                    if sent:
+                        success += 1
+                        result = 'duplicate'
+                        logger.info(f"[{idx}/{len(links)}] Duplicate of an already delivered file")
+                    else:
+                        # Rate limits or network trouble: the mapping stays for the next attempt
+                        failed += 1
+                        result = 'upload_failed'
+                        logger.error(f"[{idx}/{len(links)}] Re-send of an already delivered file failed")
+                    continue
+                
+                # Stale file_id (already forgotten): deliver this item normally
+                if not file_path:
+                    info = {}
+                    file_path = await download_media(
+                        url=item['url'],
+                        media_type=item['type'],
+                        index=idx,
+                        total=len(links),
+                        update=update,
+                        bot=context.bot,
+                        user_id=user_id,
+                        trace=trace,
+                        info=info,
+                        progress=group_progress if item['type'] == 'pdf' else None
+                    )
+            
+            if not media_exists(file_path):
+                if group_progress and not pending:
+                    # download_media already showed the failure on it
+                    group_progress = None
                 failed += 1
+                result = 'download_failed'
                 logger.error(f"[{idx}/{len(links)}] Download failed")
                 continue
             
+            if item['type'] == 'pdf' and media_size(file_path) <= GROUP_MAX_FILE_SIZE:
+                grouped = True
+                pending.append({'file_path': file_path, 'caption': caption, 'index': idx, 'trace': trace, 'info': info})
+                if len(pending) >= MAX_GROUP_SIZE:
+                    sent = await send_pending_documents(pending, len(links), update.effective_chat.id, context.bot, group_progress)
+                    success += sent
+                    failed += len(pending) - sent
+                    pending = []
+                    group_progress = None
+                continue
+            
+            if pending:
+                sent = await send_pending_documents(pending, len(links), update.effective_chat.id, context.bot, group_progress)
+                success += sent
+                failed += len(pending) - sent
+                pending = []
+                group_progress = None
+            elif group_progress:
+                # Too large for an album: this PDF goes out alone with its own upload status
+                await group_progress.finish()
+                group_progress = None
+            
             # Upload
             upload_success = await upload_media(
                 file_path=file_path,
@@ -183,26 +411,38 @@ async def handle_caption(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 total=len(links),
                 chat_id=update.effective_chat.id,
                 bot=context.bot,
-                user_id=user_id
+                user_id=user_id,
+                trace=trace
             )
             
-            # Cleanup
-            try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-            except:
-                pass
+            # Cleanup; cached downloads stay on disk for retries
+            media_cache.release(file_path)
             
             if upload_success:
                 success += 1
+                result = 'success'
+                await remember_content(item['type'], upload_success, info)
                 logger.info(f"[{idx}/{len(links)}] Successfully processed")
             else:
                 failed += 1
+                result = 'upload_failed'
                 logger.error(f"[{idx}/{len(links)}] Upload failed")
                 
         except Exception as e:
             failed += 1
             logger.error(f"[{idx}/{len(links)}] Error: {e}", exc_info=True)
+        finally:
+            ACTIVE_TASKS.dec(kind='item')
+            # Grouped items are recorded when their album is sent
+            if not grouped:
+                await record_result(trace, result)
+    
+    if pending:
+        sent = await send_pending_documents(pending, len(links), update.effective_chat.id, context.bot, group_progress)
+        success += sent
+        failed += len(pending) - sent
+    
+    ACTIVE_TASKS.dec(kind='batch')
     
     final_summary = (
         f"✅ **Batch Processing Complete!**\n\n"
@@ -224,6 +464,59 @@ async def handle_caption(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     return ConversationHandler.END
 
+async def send_pending_documents(pending, total, chat_id, bot, progress=None):
+    """Upload grouped PDFs, record their results and return how many succeeded"""
+    
+    # The group's shared download status becomes its upload status
+    status_msg = progress.status_msg if progress else None
+    try:
+        results = await upload_document_group(pending, total, chat_id, bot, status_msg)
+    except Exception as e:
+        logger.error(f"Document group error: {e}", exc_info=True)
+        results = [False] * len(pending)
+    
+    for item, ok in zip(pending, results):
+        media_cache.release(item['file_path'])
+        
+        if ok:
+            logger.info(f"[{item['index']}/{total}] Successfully processed")
+            await remember_content('pdf', ok, item['info'])
+        else:
+            logger.error(f"[{item['index']}/{total}] Upload failed")
+        await record_result(item['trace'], 'success' if ok else 'upload_failed')
+    
+    return sum(1 for ok in results if ok)
+
+async def deliver_duplicate(record, caption, chat_id, bot, trace):
+    """Re-send (or, with DUPLICATE_ACTION=skip, drop) an item whose content was delivered before
+
+    Returns 'sent', 'failed' (transient; the mapping is kept) or 'rejected'
+    (Telegram refused the file_id, so the mapping is forgotten).
+    """
+    if DUPLICATE_ACTION == 'skip':
+        return 'sent'
+    try:
+        message = await resend_file(record['file_id'], record['media_type'], caption, chat_id, bot, trace)
+    except BadRequest as e:
+        logger.warning(f"Stored file_id rejected, forgetting it: {e}")
+        await content_index.forget(record)
+        return 'rejected'
+    return 'sent' if message is not None else 'failed'
+
+async def remember_content(media_type, message, info):
+    run_in_background(content_index.remember(
+        media_type,
+        sent_file_id(message),
+        sha256=info.get('sha256'),
+        prefix=info.get('prefix'),
+        size=info.get('size')
+    ))
+
+async def record_result(trace, result):
+    ITEMS_PROCESSED.inc(media_type=trace.media_type, result=result)
+    trace.finish(result)
+    run_in_background(trace_store.save(trace))
+
 async def stop_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -234,6 +527,54 @@ async def stop_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.edit_message_text("⏹️ **Stopping... Please wait**", parse_mode='Markdown')
     logger.info(f"User {user_id} requested stop")
 
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    authorized_id = int(os.getenv('AUTHORIZED_USER_ID', 0))
+    
+    if user_id != authorized_id:
+        await update.message.reply_text("❌ You are not authorized to use this bot!")
+        return
+    
+    traces = await trace_store.recent(limit=1000)
+    if not traces:
+        await update.message.reply_text("📊 No item traces recorded yet")
+        return
+    
+    report = summarize(traces)
+    lines = [
+        "📊 **Performance Report**",
+        f"Last {report['items']} items from {report['batches']} batches\n",
+        "⏱️ **Stage latency (p50 / p95)**"
+    ]
+    for name, data in sorted(report['stages'].items()):
+        lines.append(f"• `{name}`: {_format_duration(data['p50'])} / {_format_duration(data['p95'])} ({data['count']})")
+    
+    if report['hosts']:
+        lines.append("\n⚡ **Download throughput by host (p50 / p95)**")
+        hosts = sorted(report['hosts'].items(), key=lambda h: h[1]['count'], reverse=True)[:15]
+        for host, data in hosts:
+            lines.append(f"• `{host}`: {_format_rate(data['p50'])} / {_format_rate(data['p95'])} ({data['count']})")
+    
+    # Backticks keep underscores in names like download_failed out of Markdown parsing
+    results = ', '.join(f"`{k}`: {v}" for k, v in sorted(report['results'].items()))
+    lines.append(f"\n📦 Results: {results}")
+    
+    await update.message.reply_text('\n'.join(lines), parse_mode='Markdown')
+
+def _format_duration(seconds):
+    if seconds is None:
+        return "-"
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    return f"{int(seconds/60)}m {int(seconds%60)}s"
+
+def _format_rate(bytes_per_sec):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if bytes_per_sec < 1024.0:
+            return f"{bytes_per_sec:.1f} {unit}/s"
+        bytes_per_sec /= 1024.0
+    return f"{bytes_per_sec:.1f} TB/s"
+
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     stop_flags[user_id] = True
@@ -245,16 +586,17 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info(f"User {user_id} cancelled operation")
     return ConversationHandler.END
 
-def main():
-    # Start health check server
-    threading.Thread(target=start_health_server, daemon=True).start()
-    
-    bot_token = os.getenv('BOT_TOKEN')
-    if not bot_token:
-        logger.error("BOT_TOKEN not found in environment variables!")
-        return
-    
-    app = Application.builder().token(bot_token).build()
+def build_application(bot_token, base_url=None):
+    builder = (
+        Application.builder()
+        .token(bot_token)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if base_url:
+        # Local Bot API server or a test double
+        builder = builder.base_url(base_url)
+    app = builder.build()
     
     conv_handler = ConversationHandler(
         entry_points=[CommandHandler('start', start)],
@@ -266,14 +608,29 @@ def main():
     )
     
     app.add_handler(conv_handler)
+    app.add_handler(CommandHandler('stats', stats))
     app.add_handler(CallbackQueryHandler(stop_callback, pattern='^stop_'))
+    return app
+
+def main():
+    bot_token = os.getenv('BOT_TOKEN')
+    if not bot_token:
+        logger.error("BOT_TOKEN not found in environment variables!")
+        return
+    
+    app = build_application(bot_token, os.getenv('BOT_API_URL'))
     
     logger.info("=" * 50)
     logger.info("Bot started successfully!")
     logger.info("Waiting for requests...")
     logger.info("=" * 50)
     
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
+    # Webhook mode when a public URL is configured, polling otherwise
+    webhook_url = os.getenv('WEBHOOK_URL')
+    if webhook_url:
+        asyncio.run(run_webhook(app, webhook_url))
+    else:
+        app.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
     main()
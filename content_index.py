@@ -0,0 +1,132 @@
+import time
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+HASH_COLLECTION = 'media_hashes'
+# Bytes hashed for the early fingerprint; with the size it identifies a file before it finishes
+PREFIX_BYTES = 1024 * 1024
+# After a failed lookup, answer from memory only for this long
+DB_RETRY_SECONDS = 60
+
+class ContentHasher:
+    """SHA-256 of a stream plus a fingerprint of its first PREFIX_BYTES, fed chunk by chunk"""
+
+    def __init__(self, prefix_bytes=PREFIX_BYTES):
+        self._full = hashlib.sha256()
+        self._prefix = hashlib.sha256()
+        self._prefix_left = prefix_bytes
+        self.size = 0
+        # Set as soon as the prefix has been seen, while the rest is still downloading
+        self.prefix = None
+
+    def update(self, chunk):
+        self._full.update(chunk)
+        self.size += len(chunk)
+        if self.prefix is None:
+            part = chunk[:self._prefix_left]
+            self._prefix.update(part)
+            self._prefix_left -= len(part)
+            if self._prefix_left == 0:
+                self.prefix = self._prefix.hexdigest()
+
+    def finish(self):
+        """Whole-file digest; also settles the prefix for files shorter than it"""
+        if self.prefix is None:
+            self.prefix = self._prefix.hexdigest()
+        return self._full.hexdigest()
+
+def fingerprint_file(path, prefix_bytes=PREFIX_BYTES):
+    """Prefix fingerprint of a file on disk, for files written by another process"""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read(prefix_bytes)).hexdigest()
+
+def sent_file_id(message):
+    """file_id of the video or document in a sent message, or None"""
+    media = getattr(message, 'video', None) or getattr(message, 'document', None)
+    return media.file_id if media else None
+
+class ContentIndex:
+    """Maps content hashes of delivered files to Telegram file_ids, in MongoDB when available"""
+
+    def __init__(self, db=None):
+        self._by_sha = {}
+        self._by_prefix = {}
+        self._db_retry_at = 0
+        self.attach(db)
+
+    def attach(self, db):
+        self.db = db
+        self.collection = db[HASH_COLLECTION] if db is not None else None
+
+    async def setup(self):
+        if self.collection is None:
+            return
+        try:
+            await self.collection.create_index('sha256', sparse=True)
+            await self.collection.create_index([('prefix', 1), ('size', 1), ('media_type', 1)])
+        except Exception as e:
+            logger.error(f"Hash index setup failed: {e}")
+
+    async def find(self, media_type, sha256=None, prefix=None, size=None):
+        """Delivered record matching the full hash, else the prefix fingerprint and size"""
+        if sha256:
+            record = self._by_sha.get((media_type, sha256))
+            query = {'media_type': media_type, 'sha256': sha256}
+        elif prefix and size:
+            record = self._by_prefix.get((media_type, prefix, size))
+            query = {'media_type': media_type, 'prefix': prefix, 'size': size}
+        else:
+            return None
+
+        # Lookups sit on the item path, so an unreachable database is skipped for a while
+        if record is None and self.collection is not None and time.monotonic() >= self._db_retry_at:
+            try:
+                record = await self.collection.find_one(query, {'_id': 0})
+            except Exception as e:
+                logger.warning(f"Hash lookup error, using memory only for {DB_RETRY_SECONDS}s: {e}")
+                self._db_retry_at = time.monotonic() + DB_RETRY_SECONDS
+            if record:
+                self._keep(record)
+        return record
+
+    async def remember(self, media_type, file_id, sha256=None, prefix=None, size=None):
+        if not file_id or not (sha256 or (prefix and size)):
+            return
+        record = {
+            'media_type': media_type,
+            'sha256': sha256,
+            'prefix': prefix,
+            'size': size,
+            'file_id': file_id,
+            'created_at': time.time(),
+        }
+        self._keep(record)
+        if self.collection is None:
+            return
+        key = {'media_type': media_type, 'sha256': sha256} if sha256 else \
+            {'media_type': media_type, 'prefix': prefix, 'size': size}
+        try:
+            await self.collection.replace_one(key, record, upsert=True)
+        except Exception as e:
+            logger.debug(f"Hash save error: {e}")
+
+    async def forget(self, record):
+        """Drop a mapping whose file_id Telegram no longer accepts"""
+        self._by_sha.pop((record['media_type'], record.get('sha256')), None)
+        self._by_prefix.pop((record['media_type'], record.get('prefix'), record.get('size')), None)
+        if self.collection is None:
+            return
+        try:
+            await self.collection.delete_many({'file_id': record['file_id']})
+        except Exception as e:
+            logger.debug(f"Hash delete error: {e}")
+
+    def _keep(self, record):
+        if record.get('sha256'):
+            self._by_sha[(record['media_type'], record['sha256'])] = record
+        if record.get('prefix') and record.get('size'):
+            self._by_prefix[(record['media_type'], record['prefix'], record['size'])] = record
+
+index = ContentIndex()
@@ -0,0 +1,146 @@
+import os
+import queue
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Chunks allowed in flight between the event loop and the writer thread
+QUEUE_CHUNKS = 16
+# Userspace buffer so the disk sees few large writes instead of many small ones
+WRITE_BUFFER = 4 * 1024 * 1024
+
+_CLOSE = object()
+
+class DiskWriter:
+    """Write-behind file writer: the event loop queues chunks, a dedicated thread writes them
+
+    With fileobj (e.g. a SpooledTemporaryFile) chunks go there instead of to path.
+    """
+
+    def __init__(self, path, size=0, preallocate=True, queue_chunks=QUEUE_CHUNKS, buffer_size=WRITE_BUFFER,
+                 hasher=None, fileobj=None):
+        self.path = path
+        self.size = size
+        self.fileobj = fileobj
+        # Fed on the writer thread, so hashing costs no extra pass or loop time
+        self.hasher = hasher
+        self.preallocate = preallocate
+        self.buffer_size = buffer_size
+        self.written = 0
+        self.error = None
+        self._queue = queue.Queue(maxsize=queue_chunks)
+        self._thread = threading.Thread(target=self._run, name='disk-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        self._closed = False
+        try:
+            if self.fileobj is not None:
+                self._consume(self.fileobj)
+                return
+            with open(self.path, 'wb', buffering=self.buffer_size) as f:
+                self._allocate(f)
+                self._consume(f)
+                # Drop any preallocated tail the server did not send
+                f.truncate(self.written)
+        except Exception as e:
+            self.error = e
+            # Keep draining so the producer never blocks on a full queue
+            while not self._closed and self._queue.get() is not _CLOSE:
+                pass
+
+    def _consume(self, f):
+        while True:
+            chunk = self._queue.get()
+            if chunk is _CLOSE:
+                self._closed = True
+                return
+            f.write(chunk)
+            if self.hasher:
+                self.hasher.update(chunk)
+            self.written += len(chunk)
+
+    def _allocate(self, f):
+        if not (self.preallocate and self.size > 0 and hasattr(os, 'posix_fallocate')):
+            return
+        try:
+            os.posix_fallocate(f.fileno(), 0, self.size)
+        except OSError as e:
+            # Not supported on every filesystem (e.g. some overlay/tmpfs setups)
+            logger.debug(f"fallocate skipped for {self.path}: {e}")
+
+    async def write(self, chunk):
+        """Queue a chunk; only waits when the writer thread is behind"""
+        if self.error:
+            raise self.error
+        try:
+            self._queue.put_nowait(chunk)
+        except queue.Full:
+            await asyncio.to_thread(self._queue.put, chunk)
+
+    async def close(self):
+        """Flush everything queued and raise if any write failed"""
+        await asyncio.to_thread(self._finish)
+        if self.error:
+            raise self.error
+
+    async def abort(self):
+        """Stop the thread and remove the partial file"""
+        await asyncio.to_thread(self._finish)
+        if self.fileobj is not None:
+            self.fileobj.close()
+            return
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def _finish(self):
+        if self._thread.is_alive():
+            self._queue.put(_CLOSE)
+            self._thread.join()
+
+class SpooledMedia:
+    """A finished download held in a SpooledTemporaryFile instead of under downloads/"""
+
+    def __init__(self, spool, name):
+        self.spool = spool
+        self.name = name
+        self.size = spool.tell()
+
+    @contextmanager
+    def open(self):
+        # Bytes, as the Bot API client reads the whole file anyway; the spool stays
+        # open so retries and album fallbacks can read it again
+        self.spool.seek(0)
+        yield self.spool.read()
+
+    def close(self):
+        self.spool.close()
+
+    def __str__(self):
+        return f"<spooled {self.name}>"
+
+def media_exists(media):
+    if isinstance(media, SpooledMedia):
+        return not media.spool.closed
+    return bool(media) and os.path.exists(media)
+
+def media_size(media):
+    if isinstance(media, SpooledMedia):
+        return media.size
+    return os.path.getsize(media)
+
+def media_name(media):
+    if isinstance(media, SpooledMedia):
+        return media.name
+    return os.path.basename(media)
+
+def open_media(media):
+    """Upload input for a downloaded path (file object) or SpooledMedia (bytes), as a context manager"""
+    if isinstance(media, SpooledMedia):
+        return media.open()
+    return open(media, 'rb')
@@ -1,16 +1,29 @@
 import os
 import time
 import asyncio
-import aiohttp
-import yt_dlp
 import logging
 import subprocess
 import glob
+import tempfile
+from metrics import BYTES_DOWNLOADED
+from traces import stage_timer
+from disk_writer import DiskWriter, SpooledMedia
+from media_cache import cache as media_cache
+from content_index import ContentHasher, fingerprint_file, index as content_index
+from ytdl_pool import YtdlPool
+from transcoder import scheduler as transcode_scheduler
+from uploader import scheduler as upload_scheduler
 
 logger = logging.getLogger(__name__)
 
+# Seconds between edits of a download status message
+STATUS_INTERVAL = 2
+
+# PDFs up to this size are kept in memory between download and upload (0 disables)
+SPOOL_MAX_BYTES = int(os.getenv('SPOOL_MAX_BYTES', 8 * 1024 * 1024))
+
 class DownloadProgress:
-    def __init__(self, index, total, update, bot, user_id):
+    def __init__(self, index, total, update, bot, user_id, shared=False):
         self.index = index
         self.total = total
         self.update = update
@@ -21,19 +34,43 @@ class DownloadProgress:
         self.downloaded_bytes = 0
         self.total_bytes = 0
         self.start_time = time.time()
+        self._edit_task = None
+        # One message for a run of grouped PDFs: no per-item start or success edits
+        self.shared = shared
+    
+    def begin(self, index):
+        """Reuse a shared status for the next item"""
+        self.index = index
+        self.downloaded_bytes = 0
+        self.total_bytes = 0
+        self.start_time = time.time()
     
     async def create_status_message(self, text):
         try:
-            self.status_msg = await self.update.message.reply_text(text)
+            # Status messages share the Bot API flood-wait pause with uploads
+            self.status_msg = await upload_scheduler.status(lambda: self.update.message.reply_text(text))
         except:
             pass
     
+    def due(self):
+        """Whether update_status would edit the message now"""
+        return time.time() - self.last_update_time >= STATUS_INTERVAL
+    
+    def sample(self, downloaded, total):
+        """Record progress without waiting on Telegram; an edit runs in the background when due"""
+        self.downloaded_bytes = downloaded
+        self.total_bytes = total
+        if not self.due() or (self._edit_task and not self._edit_task.done()):
+            # Skip while the previous edit is still in flight
+            return
+        self._edit_task = asyncio.create_task(self.update_status(downloaded, total))
+    
     async def update_status(self, downloaded, total):
         self.downloaded_bytes = downloaded
         self.total_bytes = total
         
         current_time = time.time()
-        if current_time - self.last_update_time < 2:
+        if current_time - self.last_update_time < STATUS_INTERVAL:
             return
         
         self.last_update_time = current_time
@@ -67,18 +104,58 @@ class DownloadProgress:
                     f"⚡ {self._format_size(speed)}/s"
                 )
             
-            await self.status_msg.edit_text(text, parse_mode='Markdown')
+            await upload_scheduler.status(lambda: self.status_msg.edit_text(text, parse_mode='Markdown'))
         except Exception as e:
             logger.debug(f"Status update error: {e}")
     
-    async def complete(self, success=True):
+    async def update_conversion(self, done, duration, preset):
+        current_time = time.time()
+        if current_time - self.last_update_time < 2 or not self.status_msg:
+            return
+        
+        self.last_update_time = current_time
+        
+        try:
+            if duration:
+                percent = min(100.0, done / duration * 100)
+                filled = int(10 * percent / 100)
+                bar = '█' * filled + '░' * (10 - filled)
+                text = (
+                    f"🔄 **Converting [{self.index}/{self.total}]**\n\n"
+                    f"`{bar}` {percent:.1f}%\n\n"
+                    f"⏱️ {self._format_time(done)} / {self._format_time(duration)}\n"
+                    f"⚙️ Preset: {preset}"
+                )
+            else:
+                text = (
+                    f"🔄 **Converting [{self.index}/{self.total}]**\n\n"
+                    f"⏱️ {self._format_time(done)} encoded\n"
+                    f"⚙️ Preset: {preset}"
+                )
+            
+            await upload_scheduler.status(lambda: self.status_msg.edit_text(text, parse_mode='Markdown'))
+        except Exception as e:
+            logger.debug(f"Conversion status update error: {e}")
+    
+    async def finish(self, success=True, text=None):
+        """Final edit of a shared status that no group upload will take over"""
+        self.shared = False
+        await self.complete(success, text)
+    
+    async def complete(self, success=True, text=None):
+        if self._edit_task and not self._edit_task.done():
+            # Let a late progress edit land before the final text, not after it
+            await asyncio.wait([self._edit_task])
+        if self.shared and success:
+            # The group's upload status takes the message over
+            return
         try:
             if self.status_msg:
-                if success:
+                if text is None and success:
                     text = f"✅ **Downloaded [{self.index}/{self.total}]**\n\n💾 {self._format_size(self.downloaded_bytes)}"
-                else:
+                elif text is None:
                     text = f"❌ **Download Failed [{self.index}/{self.total}]**"
-                await self.status_msg.edit_text(text, parse_mode='Markdown')
+                await upload_scheduler.status(lambda: self.status_msg.edit_text(text, parse_mode='Markdown'), defer=True)
         except:
             pass
     
@@ -97,23 +174,59 @@ class DownloadProgress:
         else:
             return f"{int(seconds/3600)}h {int((seconds%3600)/60)}m"
 
-async def download_media(url, media_type, index, total, update, bot, user_id):
-    """Main download function"""
+def _count_bytes(trace, size, media_type):
+    BYTES_DOWNLOADED.inc(size, media_type=media_type)
+    if trace:
+        trace.bytes_downloaded += size
+
+async def download_media(url, media_type, index, total, update, bot, user_id, trace=None, info=None, progress=None):
+    """Main download function; info receives content hashes, and 'duplicate' when dedup is on
+
+    progress may be a shared DownloadProgress reused across items (grouped PDFs).
+    """
     os.makedirs('downloads', exist_ok=True)
+    info = {} if info is None else info
     
-    progress = DownloadProgress(index, total, update, bot, user_id)
-    await progress.create_status_message(f"📥 **Starting download [{index}/{total}]...**")
+    cached = await cached_download(url, media_type, trace, info)
+    if cached:
+        logger.info(f"Serving from cache: {cached}")
+        return cached
+    
+    if progress is None:
+        progress = DownloadProgress(index, total, update, bot, user_id)
+        await progress.create_status_message(f"📥 **Starting download [{index}/{total}]...**")
+    else:
+        progress.begin(index)
+        if not progress.status_msg:
+            await progress.create_status_message(f"📥 **Downloading documents from [{index}/{total}]...**")
     
     try:
         timestamp = int(time.time() * 1000)
         output_path = f"downloads/{user_id}_{timestamp}"
         
         if media_type == 'video':
-            file_path = await download_video(url, output_path, progress)
+            file_path = await download_video(url, output_path, progress, trace)
         else:
-            file_path = await download_pdf(url, output_path, progress)
+            file_path = await download_pdf(url, output_path, progress, trace, info)
+        
+        if info.get('duplicate'):
+            await progress.complete(success=True, text=f"♻️ **Already delivered [{index}/{total}]**")
+            return None
+        
+        if isinstance(file_path, SpooledMedia):
+            # Small files stay in memory and are not worth a place in the disk cache
+            await progress.complete(success=True)
+            logger.info(f"Download successful: {file_path}")
+            return file_path
         
         if file_path and os.path.exists(file_path):
+            if not info.get('prefix'):
+                # yt-dlp writes in its own process, so only the prefix is fingerprinted
+                loop = asyncio.get_running_loop()
+                info['prefix'] = await loop.run_in_executor(None, fingerprint_file, file_path)
+                info['size'] = os.path.getsize(file_path)
+            content = {key: info.get(key) for key in ('sha256', 'prefix', 'size')}
+            file_path = media_cache.put(url, file_path, info.get('etag'), info.get('length'), content)
             await progress.complete(success=True)
             logger.info(f"Download successful: {file_path}")
             return file_path
@@ -127,61 +240,112 @@ async def download_media(url, media_type, index, total, update, bot, user_id):
         await progress.complete(success=False)
         return None
 
-async def download_video(url, output_path, progress):
+async def cached_download(url, media_type, trace=None, info=None):
+    """Path of a cached copy of url that is still current, or None"""
+    entry = media_cache.get(url)
+    if entry is None:
+        return None
+    
+    # yt-dlp sources carry no cheap validator; PDFs are checked with a HEAD request
+    if media_type == 'pdf':
+        with stage_timer(trace, 'validate', media_type):
+            fresh = await _still_fresh(url, entry)
+        if not fresh:
+            logger.info(f"Cached copy is stale: {url[:100]}")
+            media_cache.invalidate(url)
+            return None
+    
+    if trace is not None:
+        trace.cache = 'hit'
+    if info is not None:
+        info.update(entry.get('content') or {})
+    return media_cache.path(entry)
+
+async def _still_fresh(url, entry):
+    import aiohttp
+    
+    try:
+        timeout = aiohttp.ClientTimeout(total=30)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.head(url, allow_redirects=True) as response:
+                if response.status != 200:
+                    # Source unreachable: the cached copy is the best we have
+                    return True
+                etag = response.headers.get('ETag')
+                length = response.headers.get('Content-Length')
+    except Exception as e:
+        logger.debug(f"Cache validation skipped for {url[:100]}: {e}")
+        return True
+    
+    if entry.get('etag') and etag:
+        return etag == entry['etag']
+    if entry.get('length') and length:
+        return int(length) == entry['length']
+    return True
+
+YDL_OPTIONS = {
+    'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
+    'merge_output_format': 'mp4',
+    'quiet': False,
+    'no_warnings': False,
+    'geo_bypass': True,
+    'nocheckcertificate': True,
+    'allow_unplayable_formats': False,
+    'fixup': 'detect_or_warn',
+    'prefer_ffmpeg': True,
+    'postprocessors': [{
+        'key': 'FFmpegVideoConvertor',
+        'preferedformat': 'mp4',
+    }],
+    'http_headers': {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Accept-Encoding': 'gzip, deflate, br',
+    },
+    'socket_timeout': 60,
+    'retries': 5,
+    'fragment_retries': 10,
+    'extractor_retries': 5,
+    'file_access_retries': 5,
+    'extractor_args': {
+        'youtube': {
+            'skip': ['hls', 'dash']
+        }
+    },
+    'concurrent_fragment_downloads': 5,
+    'external_downloader': 'ffmpeg',
+    'external_downloader_args': ['-loglevel', 'error'],
+}
+
+# Warm yt-dlp worker processes; YTDL_WORKERS=0 runs yt-dlp in a thread instead
+YTDL_WORKERS = int(os.getenv('YTDL_WORKERS', 2))
+YTDL_MAX_JOBS = int(os.getenv('YTDL_MAX_JOBS', 20))
+ytdl_pool = YtdlPool(YDL_OPTIONS, workers=YTDL_WORKERS, max_jobs=YTDL_MAX_JOBS) if YTDL_WORKERS > 0 else None
+
+def warm_workers():
+    """Spawn yt-dlp workers ahead of the first video"""
+    if ytdl_pool:
+        ytdl_pool.warm()
+
+def shutdown_workers():
+    if ytdl_pool:
+        ytdl_pool.shutdown()
+
+async def download_video(url, output_path, progress, trace=None):
     """Download video using yt-dlp with comprehensive options"""
     
-    def progress_hook(d):
-        if d['status'] == 'downloading':
-            downloaded = d.get('downloaded_bytes', 0)
-            total = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
-            asyncio.create_task(progress.update_status(downloaded, total))
+    outtmpl = output_path + '.%(ext)s'
     
-    ydl_opts = {
-        'outtmpl': output_path + '.%(ext)s',
-        'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
-        'merge_output_format': 'mp4',
-        'quiet': False,
-        'no_warnings': False,
-        'progress_hooks': [progress_hook],
-        'geo_bypass': True,
-        'nocheckcertificate': True,
-        'allow_unplayable_formats': False,
-        'fixup': 'detect_or_warn',
-        'prefer_ffmpeg': True,
-        'postprocessors': [{
-            'key': 'FFmpegVideoConvertor',
-            'preferedformat': 'mp4',
-        }],
-        'http_headers': {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Referer': url,
-        },
-        'socket_timeout': 60,
-        'retries': 5,
-        'fragment_retries': 10,
-        'extractor_retries': 5,
-        'file_access_retries': 5,
-        'extractor_args': {
-            'youtube': {
-                'skip': ['hls', 'dash']
-            }
-        },
-        'concurrent_fragment_downloads': 5,
-        'external_downloader': 'ffmpeg',
-        'external_downloader_args': ['-loglevel', 'error'],
-    }
+    def on_progress(downloaded, total):
+        progress.sample(downloaded, total)
     
     try:
-        loop = asyncio.get_event_loop()
-        
-        def download():
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
-        
-        await loop.run_in_executor(None, download)
+        with stage_timer(trace, 'download', 'video'):
+            if ytdl_pool:
+                await ytdl_pool.download(url, outtmpl, on_progress)
+            else:
+                await _download_in_thread(url, outtmpl, on_progress)
         
         # Find downloaded file
         base_name = os.path.basename(output_path)
@@ -191,6 +355,7 @@ async def download_video(url, output_path, progress):
             files = glob.glob(pattern)
             if files:
                 logger.info(f"Found MP4 file: {files[0]}")
+                _count_bytes(trace, os.path.getsize(files[0]), 'video')
                 return files[0]
         
         # Check for any video file
@@ -200,11 +365,14 @@ async def download_video(url, output_path, progress):
             if files:
                 original_file = files[0]
                 logger.info(f"Found video file: {original_file}")
+                _count_bytes(trace, os.path.getsize(original_file), 'video')
                 
                 # Convert to mp4 if not already
                 if not original_file.endswith('.mp4'):
                     mp4_file = f"{output_path}.mp4"
-                    if await convert_to_mp4(original_file, mp4_file):
+                    with stage_timer(trace, 'convert', 'video'):
+                        converted = await convert_to_mp4(original_file, mp4_file, progress, trace)
+                    if converted:
                         try:
                             os.remove(original_file)
                         except:
@@ -220,45 +388,46 @@ async def download_video(url, output_path, progress):
         logger.error(f"Video download error: {e}", exc_info=True)
         return None
 
-async def convert_to_mp4(input_file, output_file):
-    """Convert video to mp4 using ffmpeg"""
-    try:
-        logger.info(f"Converting {input_file} to mp4...")
-        
-        cmd = [
-            'ffmpeg',
-            '-i', input_file,
-            '-c:v', 'libx264',
-            '-preset', 'medium',
-            '-crf', '23',
-            '-c:a', 'aac',
-            '-b:a', '128k',
-            '-movflags', '+faststart',
-            '-y',
-            output_file
-        ]
-        
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        stdout, stderr = await process.communicate()
-        
-        if process.returncode == 0 and os.path.exists(output_file):
-            logger.info(f"Conversion successful: {output_file}")
-            return True
-        else:
-            logger.error(f"Conversion failed: {stderr.decode()}")
-            return False
-            
-    except Exception as e:
-        logger.error(f"Conversion error: {e}", exc_info=True)
-        return False
+async def _download_in_thread(url, outtmpl, on_progress):
+    """Fallback path: fresh YoutubeDL in the default executor"""
+    import yt_dlp
+    
+    loop = asyncio.get_event_loop()
+    
+    def progress_hook(d):
+        if d['status'] == 'downloading':
+            downloaded = d.get('downloaded_bytes', 0)
+            total = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
+            loop.call_soon_threadsafe(on_progress, downloaded, total)
+    
+    ydl_opts = dict(YDL_OPTIONS)
+    ydl_opts['outtmpl'] = outtmpl
+    ydl_opts['progress_hooks'] = [progress_hook]
+    ydl_opts['http_headers'] = dict(YDL_OPTIONS['http_headers'], Referer=url)
+    
+    def download():
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            ydl.download([url])
+    
+    await loop.run_in_executor(None, download)
+
+async def convert_to_mp4(input_file, output_file, progress=None, trace=None):
+    """Convert video to mp4 using ffmpeg via the shared transcode scheduler"""
+    logger.info(f"Converting {input_file} to mp4...")
+    
+    async def on_progress(done, duration, preset):
+        if progress:
+            await progress.update_conversion(done, duration, preset)
+    
+    converted, preset = await transcode_scheduler.transcode(input_file, output_file, on_progress, trace)
+    if trace:
+        trace.conversion = f"transcode:{preset}" if converted else 'transcode_failed'
+    return converted
 
-async def download_pdf(url, output_path, progress):
-    """Download PDF file"""
+async def download_pdf(url, output_path, progress, trace=None, info=None):
+    """Download PDF file, hashing it on the way; validators and hashes go into info"""
+    import aiohttp
+    
     output_file = output_path + '.pdf'
     
     try:
@@ -270,19 +439,53 @@ async def download_pdf(url, output_path, progress):
         }
         
         async with aiohttp.ClientSession(timeout=timeout, headers=headers) as session:
-            async with session.get(url) as response:
-                if response.status != 200:
-                    logger.error(f"HTTP {response.status} for {url}")
-                    return None
-                
-                total_size = int(response.headers.get('content-length', 0))
-                downloaded = 0
-                
-                with open(output_file, 'wb') as f:
-                    async for chunk in response.content.iter_chunked(1024 * 1024):
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        await progress.update_status(downloaded, total_size)
+            with stage_timer(trace, 'download', 'pdf'):
+                async with session.get(url) as response:
+                    if response.status != 200:
+                        logger.error(f"HTTP {response.status} for {url}")
+                        return None
+                    
+                    total_size = int(response.headers.get('content-length', 0))
+                    downloaded = 0
+                    info = {} if info is None else info
+                    info['etag'] = response.headers.get('ETag')
+                    info['length'] = total_size or None
+                    # The prefix fingerprint can only be matched early when the size is known
+                    check_prefix = info.get('dedup') and total_size > 0
+                    
+                    # Disk writes and hashing happen on the writer's thread, off the event loop
+                    hasher = ContentHasher()
+                    spool = None
+                    if 0 < total_size <= SPOOL_MAX_BYTES:
+                        # Small files go to memory and straight on to the upload
+                        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, dir='downloads')
+                    writer = DiskWriter(output_file, total_size, hasher=hasher, fileobj=spool)
+                    try:
+                        async for chunk in response.content.iter_chunked(1024 * 1024):
+                            await writer.write(chunk)
+                            downloaded += len(chunk)
+                            _count_bytes(trace, len(chunk), 'pdf')
+                            progress.sample(downloaded, total_size)
+                            if check_prefix and hasher.prefix:
+                                check_prefix = False
+                                record = await content_index.find('pdf', prefix=hasher.prefix, size=total_size)
+                                if record:
+                                    logger.info(f"Content already delivered, stopping download: {url[:100]}")
+                                    info['duplicate'] = record
+                                    await writer.abort()
+                                    return None
+                        await writer.close()
+                    except BaseException:
+                        await writer.abort()
+                        raise
+                    
+                    info['sha256'] = hasher.finish()
+                    info['prefix'] = hasher.prefix
+                    info['size'] = hasher.size
+                    
+                    if spool is not None:
+                        logger.info(f"PDF downloaded to memory: {hasher.size} bytes")
+                        return SpooledMedia(spool, os.path.basename(output_file))
         
         if os.path.exists(output_file):
             logger.info(f"PDF downloaded: {output_file}")
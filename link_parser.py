@@ -1,43 +1,162 @@
+import os
 import re
-from bs4 import BeautifulSoup
+import json
 import logging
-from urllib.parse import urlparse, unquote
+from functools import lru_cache
+from urllib.parse import urlparse, unquote, urlsplit, urlunsplit, parse_qsl, urlencode
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Tracking parameters, dropped for every host
+VOLATILE_PARAMS = {
+    'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content',
+    'fbclid', 'gclid',
+}
+
+# Signature and expiry parameters of known signed-URL hosts; a rule also applies
+# to subdomains. Elsewhere a parameter like token= may be what names the file.
+HOST_RULES = {
+    'amazonaws.com': {
+        'x-amz-algorithm', 'x-amz-credential', 'x-amz-date', 'x-amz-expires',
+        'x-amz-signature', 'x-amz-signedheaders', 'x-amz-security-token',
+        'awsaccesskeyid', 'expires', 'signature',
+    },
+    'cloudfront.net': {'expires', 'signature', 'key-pair-id', 'policy'},
+    'googleapis.com': {
+        'x-goog-algorithm', 'x-goog-credential', 'x-goog-date', 'x-goog-expires',
+        'x-goog-signature', 'x-goog-signedheaders', 'googleaccessid', 'expires', 'signature',
+    },
+    'akamaihd.net': {'hdnts', 'hdnea', '__token__'},
+    'b-cdn.net': {'token', 'expires', 'token_path'},
+}
+
+def load_host_rules(path):
+    """Merge {"host": ["param", ...]} rules from a JSON file; "*" applies to every host"""
+    with open(path) as f:
+        rules = json.load(f)
+    for host, params in rules.items():
+        params = {param.lower() for param in params}
+        if host == '*':
+            VOLATILE_PARAMS.update(params)
+        else:
+            HOST_RULES.setdefault(host.lower(), set()).update(params)
+    volatile_params.cache_clear()
+
+@lru_cache(maxsize=1024)
+def volatile_params(host):
+    params = VOLATILE_PARAMS
+    parts = host.split('.')
+    for i in range(len(parts) - 1):
+        rule = HOST_RULES.get('.'.join(parts[i:]))
+        if rule:
+            params = params | rule
+    return params
+
+if os.getenv('CANONICAL_RULES_FILE'):
+    try:
+        load_host_rules(os.getenv('CANONICAL_RULES_FILE'))
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not load canonical URL rules: {e}")
+
+def canonical_url(url):
+    """Stable key for a link: equivalent URLs to the same file map to the same string
+
+    Lowercases scheme and host, drops www., default ports, fragments and volatile
+    query parameters, and sorts what is left. Only used for dedup and caching;
+    downloads still use the original URL.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    netloc = host
+    if port and port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{host}:{port}"
+    query = ''
+    if parts.query:
+        volatile = volatile_params(host)
+        query = urlencode(sorted(
+            (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+            if key.lower() not in volatile
+        ))
+    return urlunsplit((scheme, netloc, parts.path or '/', query, ''))
+
 def extract_all_links(content):
     """Extract all media links from content (HTML or TXT)"""
     
-    links = []
-    seen_urls = set()
-    
     logger.info("Starting link extraction...")
     
-    # Try HTML parsing first
-    html_links = extract_from_html(content)
-    for link in html_links:
-        url = link['url']
-        if url not in seen_urls:
-            links.append(link)
-            seen_urls.add(url)
-    
-    # Try text parsing
-    text_links = extract_from_text(content)
-    for link in text_links:
-        url = link['url']
-        if url not in seen_urls:
-            links.append(link)
-            seen_urls.add(url)
+    # HTML links first, then plain text; the first link for each key wins. Both
+    # passes are classified together so a URL found by each is scored once.
+    index = build_link_index(typed_links(html_candidates(content) + text_candidates(content)))
+    links = list(index.values())
     
     logger.info(f"Total links extracted: {len(links)}")
     return links
 
+def build_link_index(links):
+    """Map canonical key -> first link with that key, dropping equivalent URLs"""
+    
+    index = {}
+    duplicates = 0
+    for link in links:
+        key = link.setdefault('key', canonical_url(link['url']))
+        if key in index:
+            duplicates += 1
+            continue
+        index[key] = link
+    
+    if duplicates:
+        logger.info(f"Dropped {duplicates} links equivalent to earlier ones")
+    return index
+
+def make_link(url, media_type, caption, confident=True):
+    link = {
+        'url': url,
+        'type': media_type,
+        'caption': caption or 'Media File'
+    }
+    if not confident:
+        # Best guess only; bot resolves these with a Content-Type probe
+        link['ambiguous'] = True
+    return link
+
+def typed_links(candidates):
+    """Turn (url, caption) pairs into links, classifying each distinct URL once"""
+    
+    types = classify_all(url for url, _ in candidates)
+    links = []
+    for url, caption in candidates:
+        media_type, confident = types[url]
+        if media_type:
+            links.append(make_link(url, media_type, caption, confident))
+            logger.debug(f"Found {media_type} - {url[:100]}")
+    return links
+
 def extract_from_html(content):
     """Extract links from HTML content"""
+    return typed_links(html_candidates(content))
+
+def extract_from_text(content):
+    """Extract links from plain text"""
+    return typed_links(text_candidates(content))
+
+def html_candidates(content):
+    """(url, caption) for every valid <a href> in HTML content"""
     
-    links = []
+    candidates = []
     
     try:
+        # bs4 is only needed once a file arrives, so keep it off the startup path
+        from bs4 import BeautifulSoup
+        
         soup = BeautifulSoup(content, 'html.parser')
         
         # Find all <a> tags
@@ -49,24 +168,17 @@ def extract_from_html(content):
             url = clean_url(url)
             
             if url and is_valid_url(url):
-                media_type = detect_media_type(url)
-                if media_type:
-                    links.append({
-                        'url': url,
-                        'type': media_type,
-                        'caption': caption or 'Media File'
-                    })
-                    logger.debug(f"HTML: Found {media_type} - {url[:100]}")
+                candidates.append((url, caption))
     
     except Exception as e:
         logger.debug(f"HTML parsing error: {e}")
     
-    return links
+    return candidates
 
-def extract_from_text(content):
-    """Extract links from plain text"""
+def text_candidates(content):
+    """(url, caption) for every valid URL in plain text"""
     
-    links = []
+    candidates = []
     
     lines = content.split('\n')
     
@@ -95,16 +207,9 @@ def extract_from_text(content):
             url = clean_url(url)
             
             if url and is_valid_url(url):
-                media_type = detect_media_type(url)
-                if media_type:
-                    links.append({
-                        'url': url,
-                        'type': media_type,
-                        'caption': caption or 'Media File'
-                    })
-                    logger.debug(f"TEXT: Found {media_type} - {url[:100]}")
+                candidates.append((url, caption))
     
-    return links
+    return candidates
 
 def find_all_urls(text):
     """Find all URLs in text using multiple patterns"""
@@ -165,43 +270,134 @@ def is_valid_url(url):
     except:
         return False
 
+VIDEO_EXTENSIONS = (
+    'mp4', 'mkv', 'avi', 'mov', 'flv', 'webm', 'm4v', '3gp', 'wmv', 'mpg', 'mpeg', 'm2v', 'ts',
+    'm3u8', 'm3u',
+)
+
+# Hosts that only serve video pages or streams; subdomains included
+VIDEO_HOSTS = (
+    'youtube.com', 'youtu.be', 'vimeo.com', 'dailymotion.com', 'dai.ly',
+    'hranker.com', 'selectionway.com',
+)
+# Platforms that serve video under several domains; matched as a host label with any TLD
+VIDEO_HOST_LABELS = ('selectionway',)
+
+# Signal scores; a type is settled when it reaches STRONG_SCORE with a lead of CLEAR_LEAD
+STRONG_SCORE = 3
+CLEAR_LEAD = 2
+
+EXTENSION_TYPES = dict.fromkeys(VIDEO_EXTENSIONS, 'video')
+EXTENSION_TYPES['pdf'] = 'pdf'
+
+# Weak host hints: these serve either kind (or anything), so alone they only earn a probe
+HOST_RE = re.compile(
+    r'(?:^|\.)(?:' + '|'.join(map(re.escape, VIDEO_HOSTS)) + r')$'
+    r'|(?:^|\.)(?:' + '|'.join(map(re.escape, VIDEO_HOST_LABELS)) + r')\.'
+)
+HOST_HINT_RE = re.compile(
+    r'(?P<video>cdn|stream|video|player|vod|media|cloudfront|cloudflare|amazonaws)|(?P<pdf>pdf|docs?\b|document)'
+)
+
+# Path segments naming a media directory score 2; words anywhere in the path score 1
+VIDEO_DIRS = frozenset((
+    'hls', 'dash', 'video', 'videos', 'stream', 'watch', 'embed', 'v', 'player', 'live',
+    'lecture', 'lectures', 'media',
+))
+PDF_DIRS = frozenset(('pdf', 'pdfs', 'document', 'documents', 'notes', 'ebook', 'ebooks'))
+VIDEO_WORDS = ('.m3u8', '.mp4', '.mpd', 'manifest', 'playlist', 'master')
+PDF_WORDS = ('pdf', 'document')
+
+# Query strings are mostly tokens; only look for file names passed as parameters
+QUERY_HINTS = (('video', ('.m3u8', '.mp4')), ('pdf', ('pdf',)))
+
+# Substrings the parser used to type links by. A link that scores nothing but
+# contains one is kept as ambiguous, so the probe decides instead of dropping it.
+FALLBACK_HINTS = (
+    ('video', ('.mkv', '.avi', '.mov', '.flv', '.webm', '.m4v', '.3gp', '.wmv', '.mpg', '.m2v', '.ts',
+               '/media/', 'amazonaws.com', 'cloudflare', 'dailymotion', 'cdn', 'player',
+               'hranker.com', 'selectionway', 'youtube.com', 'youtu.be', 'vimeo.com')),
+    ('pdf', ('pdf', 'document')),
+)
+
+@lru_cache(maxsize=4096)
+def _host_scores(host):
+    if HOST_RE.search(host):
+        return STRONG_SCORE, 0
+    video = pdf = 0
+    for match in HOST_HINT_RE.finditer(host):
+        if match.group('video'):
+            video = 1
+        else:
+            pdf = 1
+    return video, pdf
+
+def classify(url):
+    """Score a link as video or PDF from its host, path and extension
+
+    Returns (media_type, confident); media_type is None when nothing matches,
+    and confident is False when the link needs a Content-Type probe.
+    """
+    url = url.lower()
+    scheme, sep, rest = url.partition('://')
+    if not sep:
+        return None, False
+    # str.partition is several times cheaper than urlsplit or a regex here
+    if '#' in rest:
+        rest = rest.partition('#')[0]
+    rest, _, query = rest.partition('?')
+    host, _, path = rest.partition('/')
+    if '@' in host or ':' in host:
+        host = host.rpartition('@')[2].partition(':')[0]
+
+    video, pdf = _host_scores(host)
+
+    segments = path.split('/')
+    name = segments[-1]
+    if '.' in name:
+        extension = EXTENSION_TYPES.get(name.rpartition('.')[2])
+        if extension == 'video':
+            video += STRONG_SCORE
+        elif extension == 'pdf':
+            pdf += STRONG_SCORE
+
+    if not VIDEO_DIRS.isdisjoint(segments):
+        video += 2
+    if not PDF_DIRS.isdisjoint(segments):
+        pdf += 2
+    for word in VIDEO_WORDS:
+        if word in path:
+            video += 1
+            break
+    for word in PDF_WORDS:
+        if word in path:
+            pdf += 1
+            break
+
+    if query:
+        for media_type, hints in QUERY_HINTS:
+            for hint in hints:
+                if hint in query:
+                    if media_type == 'video':
+                        video += 1
+                    else:
+                        pdf += 1
+                    break
+
+    if not video and not pdf:
+        for media_type, hints in FALLBACK_HINTS:
+            for hint in hints:
+                if hint in url:
+                    return media_type, False
+        return None, False
+    best, other = ('video', pdf) if video >= pdf else ('pdf', video)
+    top = max(video, pdf)
+    return best, top >= STRONG_SCORE and top - other >= CLEAR_LEAD
+
+def classify_all(urls):
+    """Classify a batch of URLs; returns {url: (media_type, confident)} with each distinct URL scored once"""
+    return {url: classify(url) for url in dict.fromkeys(urls)}
+
 def detect_media_type(url):
     """Detect if URL is video or PDF"""
-    
-    url_lower = url.lower()
-    
-    # Video patterns (comprehensive)
-    video_patterns = [
-        # File extensions
-        '.mp4', '.mkv', '.avi', '.mov', '.flv', '.webm', '.m4v',
-        '.3gp', '.wmv', '.mpg', '.mpeg', '.m2v', '.ts',
-        
-        # Streaming formats
-        '.m3u8', 'master.m3u8', 'playlist.m3u8', '.m3u',
-        
-        # Domain/path patterns
-        '/hls/', '/video/', '/stream/', '/media/', '/watch/',
-        'hranker.com', 'amazonaws.com', 'cloudflare', 'selectionway',
-        'youtube.com', 'youtu.be', 'vimeo.com', 'dailymotion',
-        'cdn', 'player', '/v/', '/embed/'
-    ]
-    
-    for pattern in video_patterns:
-        if pattern in url_lower:
-            return 'video'
-    
-    # PDF patterns
-    pdf_patterns = ['.pdf', 'pdf', '/pdfs/', 'document']
-    
-    for pattern in pdf_patterns:
-        if pattern in url_lower:
-            return 'pdf'
-    
-    # Check file extension at end
-    if url_lower.endswith(tuple(video_patterns)):
-        return 'video'
-    
-    if url_lower.endswith('.pdf'):
-        return 'pdf'
-    
-    return None
+    return classify(url)[0]
@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from link_parser import canonical_url
+from disk_writer import SpooledMedia
+from metrics import CACHE_REQUESTS, CACHE_BYTES
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.json'
+class MediaCache:
+    """Completed downloads kept on disk up to a byte budget, evicted least recently used first"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        # Files handed out for an upload that has not finished yet
+        self._pinned = {}
+        self._loaded = False
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _load(self):
+        # Deferred to first use; spawned worker processes import this module too
+        if self._loaded:
+            return
+        self._loaded = True
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            with open(os.path.join(self.directory, INDEX_FILE)) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = []
+
+        # Oldest first, so the OrderedDict ends with the most recently used
+        for entry in sorted(entries, key=lambda e: e.get('used', 0)):
+            path = os.path.join(self.directory, entry['file'])
+            if os.path.isfile(path) and os.path.getsize(path) == entry['size']:
+                self.entries[entry['key']] = entry
+                self.total_bytes += entry['size']
+
+        # Anything not in the index is a leftover from a crash
+        known = {entry['file'] for entry in self.entries.values()}
+        for name in os.listdir(self.directory):
+            if name != INDEX_FILE and name not in known:
+                self._remove_file(name)
+
+        CACHE_BYTES.set(self.total_bytes)
+        logger.info(f"Media cache: {len(self.entries)} files, {self.total_bytes} bytes")
+
+    def _save(self):
+        path = os.path.join(self.directory, INDEX_FILE)
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(list(self.entries.values()), f)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            logger.warning(f"Media cache index not saved: {e}")
+
+    def get(self, url):
+        """Cache entry for url, or None; the entry's file stays on disk until release()"""
+        if not self.enabled:
+            return None
+        self._load()
+        key = canonical_url(url)
+        entry = self.entries.get(key)
+        if entry is None:
+            CACHE_REQUESTS.inc(result='miss')
+            return None
+        path = self.path(entry)
+        if not os.path.isfile(path):
+            self._drop(key)
+            CACHE_REQUESTS.inc(result='miss')
+            return None
+        entry['used'] = time.time()
+        self.entries.move_to_end(key)
+        self._pin(path)
+        self._save()
+        CACHE_REQUESTS.inc(result='hit')
+        return entry
+
+    def path(self, entry):
+        return os.path.join(self.directory, entry['file'])
+    
+    def lookup(self, name):
+        """Path of the cached file with this name, or None for anything else in the directory"""
+        if not self.enabled:
+            return None
+        self._load()
+        for entry in self.entries.values():
+            if entry['file'] == name:
+                path = self.path(entry)
+                return path if os.path.isfile(path) else None
+        return None
+
+    def invalidate(self, url):
+        """Forget url because the source no longer matches what was cached"""
+        key = canonical_url(url)
+        entry = self.entries.get(key)
+        if entry:
+            self._pinned.pop(self.path(entry), None)
+            self._drop(key)
+            self._save()
+            CACHE_REQUESTS.inc(result='stale')
+
+    def put(self, url, file_path, etag=None, length=None, content=None):
+        """Move a finished download into the cache and return its new path"""
+        if not self.enabled:
+            return file_path
+        self._load()
+        size = os.path.getsize(file_path)
+        if size > self.max_bytes:
+            return file_path
+
+        key = canonical_url(url)
+        if key in self.entries:
+            self._drop(key)
+
+        ext = os.path.splitext(file_path)[1]
+        name = hashlib.sha1(key.encode()).hexdigest() + ext
+        path = os.path.join(self.directory, name)
+        os.replace(file_path, path)
+
+        self.entries[key] = {
+            'key': key,
+            'file': name,
+            'size': size,
+            'etag': etag,
+            'length': length,
+            'content': content,
+            'used': time.time(),
+        }
+        self.total_bytes += size
+        self._pin(path)
+        self._evict()
+        self._save()
+        CACHE_BYTES.set(self.total_bytes)
+        return path
+
+    def release(self, file_path):
+        """Done with a file: cached files stay, anything else is deleted"""
+        if isinstance(file_path, SpooledMedia):
+            file_path.close()
+            return
+        if self.enabled:
+            self._load()
+        count = self._pinned.pop(file_path, 0)
+        if count > 1:
+            self._pinned[file_path] = count - 1
+        if self._is_cached(file_path):
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+                self._save()
+            return
+        try:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        except OSError:
+            pass
+
+    def _pin(self, path):
+        self._pinned[path] = self._pinned.get(path, 0) + 1
+
+    def _is_cached(self, file_path):
+        if os.path.dirname(os.path.abspath(file_path)) != os.path.abspath(self.directory):
+            return False
+        name = os.path.basename(file_path)
+        return any(entry['file'] == name for entry in self.entries.values())
+
+    def _evict(self):
+        for key in list(self.entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if self.path(self.entries[key]) in self._pinned:
+                continue
+            logger.info(f"Media cache evicting {key[:100]}")
+            self._drop(key)
+
+    def _drop(self, key):
+        entry = self.entries.pop(key)
+        self.total_bytes -= entry['size']
+        self._remove_file(entry['file'])
+        CACHE_BYTES.set(self.total_bytes)
+
+    def _remove_file(self, name):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
+
+cache = MediaCache(
+    os.getenv('CACHE_DIR', 'downloads/cache'),
+    int(os.getenv('CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+)
@@ -0,0 +1,98 @@
+import os
+import asyncio
+import logging
+from collections import OrderedDict
+from link_parser import canonical_url
+from metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Concurrent probes per batch and how long one may take
+PROBE_CONCURRENCY = 8
+PROBE_TIMEOUT = 10
+# Whole probe pass; the file handler waits on it, so unfinished links keep the classifier's guess
+PROBE_DEADLINE = float(os.getenv('PROBE_DEADLINE', 20))
+CACHE_SIZE = 10000
+
+VIDEO_CONTENT_TYPES = (
+    'application/vnd.apple.mpegurl', 'application/x-mpegurl', 'audio/mpegurl', 'application/dash+xml',
+)
+
+# Canonical link key -> probed media type (None when the server did not say)
+_cache = OrderedDict()
+
+def media_type_for(content_type):
+    """Media type implied by a Content-Type header, or None"""
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type == 'application/pdf':
+        return 'pdf'
+    if content_type.startswith('video/') or content_type in VIDEO_CONTENT_TYPES:
+        return 'video'
+    return None
+
+async def probe_media_type(session, url):
+    """Ask the server what url is: HEAD first, then a one-byte GET for servers that refuse HEAD"""
+    key = canonical_url(url)
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+
+    try:
+        async with session.head(url, allow_redirects=True) as response:
+            status = response.status
+            content_type = response.headers.get('Content-Type')
+        if status >= 400:
+            async with session.get(url, headers={'Range': 'bytes=0-0'}, allow_redirects=True) as response:
+                status = response.status
+                content_type = response.headers.get('Content-Type')
+    except Exception as e:
+        # Not cached: the host may only be down for a moment
+        logger.debug(f"Probe failed for {url[:100]}: {e}")
+        return None
+
+    media_type = media_type_for(content_type) if status < 400 else None
+    _cache[key] = media_type
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return media_type
+
+async def resolve_ambiguous(links):
+    """Settle the type of links the classifier was unsure about; returns how many changed"""
+    import aiohttp
+
+    pending = [link for link in links if link.get('ambiguous')]
+    if not pending:
+        return 0
+
+    semaphore = asyncio.Semaphore(PROBE_CONCURRENCY)
+    timeout = aiohttp.ClientTimeout(total=PROBE_TIMEOUT)
+    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
+
+    async def probe(session, link):
+        async with semaphore:
+            with STAGE_SECONDS.time(stage='link_probe', media_type=link['type']):
+                return await probe_media_type(session, link['url'])
+
+    async with aiohttp.ClientSession(timeout=timeout, headers=headers) as session:
+        tasks = [asyncio.create_task(probe(session, link)) for link in pending]
+        done, late = await asyncio.wait(tasks, timeout=PROBE_DEADLINE)
+        for task in late:
+            task.cancel()
+        if late:
+            await asyncio.gather(*late, return_exceptions=True)
+            logger.warning(f"Probe deadline of {PROBE_DEADLINE:.0f}s reached, {len(late)} links keep their guessed type")
+
+    changed = 0
+    for link, task in zip(pending, tasks):
+        media_type = task.result() if task in done else None
+        if media_type is None:
+            # Keep the classifier's best guess
+            continue
+        if media_type != link['type']:
+            logger.info(f"Probe reclassified {link['url'][:100]} as {media_type}")
+            link['type'] = media_type
+            changed += 1
+        del link['ambiguous']
+
+    logger.info(f"Probed {len(pending)} ambiguous links, {changed} reclassified")
+    return changed
@@ -0,0 +1,179 @@
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Default latency buckets in seconds (probe calls up to multi-GB downloads)
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+_registry = []
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label, '')) for label in self.labels)
+
+    def _format_labels(self, key, extra=None):
+        pairs = list(zip(self.labels, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ''
+        body = ','.join(f'{k}="{_escape(v)}"' for k, v in pairs)
+        return '{' + body + '}'
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._render_samples())
+        return lines
+
+class Counter(_Metric):
+    """Monotonically increasing value"""
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def _render_samples(self):
+        if not self.values and not self.labels:
+            return [f"{self.name} 0"]
+        return [f"{self.name}{self._format_labels(k)} {v}" for k, v in self.values.items()]
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self.values = {}
+
+    def set(self, value, **labels):
+        self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def _render_samples(self):
+        if not self.values and not self.labels:
+            return [f"{self.name} 0"]
+        return [f"{self.name}{self._format_labels(k)} {v}" for k, v in self.values.items()]
+
+class Histogram(_Metric):
+    """Bucketed distribution of observed values"""
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        state = self.values.get(key)
+        if state is None:
+            state = self.values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state['counts'][i] += 1
+        state['sum'] += value
+        state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time spent inside the block"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def _render_samples(self):
+        lines = []
+        for key, state in self.values.items():
+            for bound, count in zip(self.buckets, state['counts']):
+                lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', bound))} {count}")
+            lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', '+Inf'))} {state['count']}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {state['sum']}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {state['count']}")
+        return lines
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render_metrics():
+    """Render all registered metrics in Prometheus text format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+# Pipeline metrics
+BYTES_DOWNLOADED = Counter('bot_bytes_downloaded_total', 'Bytes received from media sources', ['media_type'])
+BYTES_UPLOADED = Counter('bot_bytes_uploaded_total', 'Bytes sent to Telegram', ['media_type'])
+STAGE_SECONDS = Histogram('bot_stage_seconds', 'Per-item stage latency', ['stage', 'media_type'])
+ITEMS_PROCESSED = Counter('bot_items_total', 'Processed batch items by result', ['media_type', 'result'])
+QUEUE_DEPTH = Gauge('bot_queue_depth', 'Items waiting to be processed', ['queue'])
+ACTIVE_TASKS = Gauge('bot_active_tasks', 'Work currently in progress', ['kind'])
+RETRIES = Counter('bot_retries_total', 'Retried operations', ['operation'])
+FLOOD_WAITS = Counter('bot_flood_waits_total', 'Telegram 429 flood-wait responses')
+FLOOD_WAIT_SECONDS = Counter('bot_flood_wait_seconds_total', 'Seconds spent waiting on Telegram flood control')
+CACHE_REQUESTS = Counter('bot_media_cache_requests_total', 'Media cache lookups by result', ['result'])
+CACHE_BYTES = Gauge('bot_media_cache_bytes', 'Bytes held in the media cache')
+LOOP_LAG = Gauge('bot_event_loop_lag_seconds', 'Most recent event loop scheduling lag')
+
+class LoopLagMonitor:
+    """Measure how late the event loop wakes up from a fixed sleep"""
+
+    def __init__(self, interval=1.0, threshold=5.0):
+        self.interval = interval
+        self.threshold = threshold
+        self.lag = 0.0
+        self.last_beat = time.monotonic()
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.lag = max(0.0, now - expected)
+            self.last_beat = now
+            LOOP_LAG.set(round(self.lag, 4))
+            if self.lag > self.threshold:
+                logger.warning(f"Event loop lag: {self.lag:.2f}s")
+
+    def is_healthy(self):
+        # A stalled loop stops updating last_beat, so check staleness as well as lag
+        stale = time.monotonic() - self.last_beat
+        return self.lag <= self.threshold and stale <= self.interval + self.threshold
@@ -0,0 +1,84 @@
+import os
+import hmac
+import logging
+from aiohttp import web
+from telegram import Update
+from metrics import LoopLagMonitor, render_metrics
+
+logger = logging.getLogger(__name__)
+
+lag_monitor = LoopLagMonitor()
+
+async def index_handler(request):
+    return web.Response(text='Bot is running!')
+
+async def health_handler(request):
+    status = 200 if lag_monitor.is_healthy() else 503
+    text = (
+        f"status: {'ok' if status == 200 else 'unhealthy'}\n"
+        f"event_loop_lag_seconds: {lag_monitor.lag:.4f}\n"
+    )
+    return web.Response(status=status, text=text)
+
+async def metrics_handler(request):
+    return web.Response(text=render_metrics(), content_type='text/plain', charset='utf-8')
+
+def webhook_handler(application, secret_token):
+    """Feed Telegram webhook updates straight into the application's update queue"""
+
+    async def handle(request):
+        if secret_token:
+            received = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+            if not hmac.compare_digest(received, secret_token):
+                return web.Response(status=403)
+        try:
+            data = await request.json()
+        except Exception:
+            return web.Response(status=400)
+        await application.update_queue.put(Update.de_json(data, application.bot))
+        return web.Response()
+
+    return handle
+
+def file_handler(files_cache, files_token):
+    """Serve finished downloads from the media cache to clients holding the delivery token"""
+
+    async def handle(request):
+        if not hmac.compare_digest(request.match_info['token'], files_token):
+            return web.Response(status=403)
+        name = os.path.basename(request.match_info['name'])
+        # Only complete cache entries; in-flight downloads and the index are never served
+        path = files_cache.lookup(name) if name else None
+        if path is None:
+            return web.Response(status=404)
+        return web.FileResponse(path)
+
+    return handle
+
+def build_web_app(application=None, webhook_path=None, secret_token=None, files_cache=None, files_token=None):
+    """Create the aiohttp app serving health, metrics and optional webhook/file routes"""
+    web_app = web.Application()
+    web_app.router.add_get('/', index_handler)
+    web_app.router.add_get('/health', health_handler)
+    web_app.router.add_get('/metrics', metrics_handler)
+    if application is not None and webhook_path:
+        web_app.router.add_post(webhook_path, webhook_handler(application, secret_token))
+    if files_cache is not None and files_token:
+        web_app.router.add_get('/files/{token}/{name}', file_handler(files_cache, files_token))
+    return web_app
+
+async def start_web_server(port, web_app=None):
+    """Start the HTTP server inside the running event loop"""
+    web_app = web_app or build_web_app()
+    runner = web.AppRunner(web_app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '0.0.0.0', port)
+    await site.start()
+    lag_monitor.start()
+    logger.info(f"Web server started on port {port}")
+    return runner
+
+async def stop_web_server(runner):
+    await lag_monitor.stop()
+    if runner:
+        await runner.cleanup()
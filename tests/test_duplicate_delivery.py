@@ -0,0 +1,49 @@
+import asyncio
+import pytest
+from telegram.error import RetryAfter, BadRequest, TimedOut
+
+import bot
+import uploader
+from content_index import ContentIndex
+
+RECORD = {'media_type': 'pdf', 'sha256': 'abc', 'prefix': None, 'size': None, 'file_id': 'FILE1'}
+
+class FakeBot:
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    async def send_document(self, **kwargs):
+        self.calls += 1
+        raise self.error
+
+@pytest.fixture
+def index(monkeypatch):
+    index = ContentIndex()
+    asyncio.run(index.remember('pdf', 'FILE1', sha256='abc'))
+    monkeypatch.setattr(bot, 'content_index', index)
+    # No real pauses or pacing between attempts
+    scheduler = uploader.UploadScheduler(chat_interval=0, backoff_base=0)
+    monkeypatch.setattr(scheduler, 'flood_wait', lambda retry_after: 0)
+    monkeypatch.setattr(uploader, 'scheduler', scheduler)
+    return index
+
+def deliver(fake_bot):
+    return asyncio.run(bot.deliver_duplicate(dict(RECORD), 'caption', 1, fake_bot, None))
+
+def test_retry_after_during_resend_keeps_mapping(index):
+    fake_bot = FakeBot(RetryAfter(1))
+    assert deliver(fake_bot) == 'failed'
+    # Same flood-wait allowance as a normal upload
+    assert fake_bot.calls == 5
+    assert asyncio.run(index.find('pdf', sha256='abc'))['file_id'] == 'FILE1'
+
+def test_network_error_during_resend_keeps_mapping(index):
+    assert deliver(FakeBot(TimedOut())) == 'failed'
+    assert asyncio.run(index.find('pdf', sha256='abc')) is not None
+
+def test_rejected_file_id_is_forgotten(index):
+    fake_bot = FakeBot(BadRequest('Wrong file identifier/http url specified'))
+    assert deliver(fake_bot) == 'rejected'
+    assert fake_bot.calls == 1
+    assert asyncio.run(index.find('pdf', sha256='abc')) is None
@@ -0,0 +1,115 @@
+from link_parser import canonical_url, classify, classify_all, extract_all_links
+
+def test_canonical_url_normalizes_equivalent_forms():
+    assert canonical_url('HTTPS://WWW.Example.com:443/a.pdf#page=2') == 'https://example.com/a.pdf'
+    assert canonical_url('https://example.com/a.pdf?b=2&a=1') == canonical_url('https://example.com/a.pdf?a=1&b=2')
+
+def test_canonical_url_drops_tracking_params_everywhere():
+    assert canonical_url('https://example.com/a.pdf?utm_source=tg&fbclid=x&id=7') == 'https://example.com/a.pdf?id=7'
+
+def test_canonical_url_keeps_token_on_unknown_hosts():
+    # The token is what names the lecture here; dropping it would merge different items
+    first = canonical_url('https://api.example.com/play.m3u8?token=AAA111')
+    second = canonical_url('https://api.example.com/play.m3u8?token=BBB222')
+    assert first != second
+
+def test_canonical_url_keeps_signature_and_expiry_on_unknown_hosts():
+    for param in ('sig', 'signature', 'exp', 'expires'):
+        first = canonical_url(f'https://files.example.org/get?{param}=1&id=9')
+        second = canonical_url(f'https://files.example.org/get?{param}=2&id=9')
+        assert first != second, param
+
+def test_canonical_url_drops_signatures_of_known_signing_hosts():
+    signed = [
+        ('https://d1.cloudfront.net/v/1.m3u8?Expires=1&Signature=aa&Key-Pair-Id=K1',
+         'https://d1.cloudfront.net/v/1.m3u8?Expires=2&Signature=bb&Key-Pair-Id=K1'),
+        ('https://bucket.s3.amazonaws.com/a.pdf?X-Amz-Date=1&X-Amz-Signature=aa',
+         'https://bucket.s3.amazonaws.com/a.pdf?X-Amz-Date=2&X-Amz-Signature=bb'),
+        ('https://storage.googleapis.com/b/a.pdf?GoogleAccessId=x&Expires=1&Signature=aa',
+         'https://storage.googleapis.com/b/a.pdf?GoogleAccessId=x&Expires=2&Signature=bb'),
+        ('https://zone.b-cdn.net/v.mp4?token=aa&expires=1',
+         'https://zone.b-cdn.net/v.mp4?token=bb&expires=2'),
+    ]
+    for first, second in signed:
+        assert canonical_url(first) == canonical_url(second), first
+
+def test_extract_keeps_items_that_differ_only_by_token():
+    content = (
+        'Lecture 1: https://api.example.com/play.m3u8?token=AAA111\n'
+        'Lecture 2: https://api.example.com/play.m3u8?token=BBB222\n'
+    )
+    captions = [link['caption'] for link in extract_all_links(content)]
+    assert captions == ['Lecture 1', 'Lecture 2']
+
+def test_extract_dedups_resigned_links_on_signing_hosts():
+    content = (
+        'Lecture 1: https://d1.cloudfront.net/v/1.m3u8?Expires=1&Signature=aa&Key-Pair-Id=K1\n'
+        'Lecture 1 again: https://d1.cloudfront.net/v/1.m3u8?Expires=2&Signature=bb&Key-Pair-Id=K1\n'
+    )
+    assert len(extract_all_links(content)) == 1
+
+def test_classify_keeps_links_the_substring_rules_found_as_ambiguous():
+    for url in (
+        'https://bucket.s3.amazonaws.com/abc123',
+        'https://s3.ap-south-1.amazonaws.com/bucket/lec12',
+        'https://abc.cloudflare.com/abc',
+        'https://example.com/media/xyz',
+    ):
+        assert classify(url) == ('video', False), url
+
+def test_classify_confident_and_dropped_links():
+    assert classify('https://cdn.example.com/videos/lecture_1.mp4') == ('video', True)
+    assert classify('https://notes.example.org/pdfs/DPP_4.pdf') == ('pdf', True)
+    assert classify('https://www.youtube.com/watch?v=abc') == ('video', True)
+    assert classify('https://t.me/abcdefgh') == (None, False)
+
+def test_classify_all_matches_classify():
+    urls = ['https://abc.cloudflare.com/abc', 'https://notes.example.org/a.pdf', 'https://abc.cloudflare.com/abc']
+    assert classify_all(urls) == {url: classify(url) for url in urls}
+
+def test_extract_marks_unscored_links_ambiguous():
+    links = extract_all_links('Lecture 3: https://bucket.s3.amazonaws.com/abc123\n')
+    assert [(link['type'], link.get('ambiguous')) for link in links] == [('video', True)]
+
+# The substring rules detect_media_type used before scoring, checked in this order
+BASELINE_VIDEO_PATTERNS = [
+    '.mp4', '.mkv', '.avi', '.mov', '.flv', '.webm', '.m4v', '.3gp', '.wmv', '.mpg', '.mpeg', '.m2v', '.ts',
+    '.m3u8', 'master.m3u8', 'playlist.m3u8', '.m3u',
+    '/hls/', '/video/', '/stream/', '/media/', '/watch/',
+    'hranker.com', 'amazonaws.com', 'cloudflare', 'selectionway',
+    'youtube.com', 'youtu.be', 'vimeo.com', 'dailymotion',
+    'cdn', 'player', '/v/', '/embed/',
+]
+BASELINE_PDF_PATTERNS = ['.pdf', 'pdf', '/pdfs/', 'document']
+
+def baseline_detect_media_type(url):
+    url = url.lower()
+    if any(pattern in url for pattern in BASELINE_VIDEO_PATTERNS):
+        return 'video'
+    if any(pattern in url for pattern in BASELINE_PDF_PATTERNS):
+        return 'pdf'
+    return None
+
+def baseline_shapes(pattern):
+    """URLs where pattern is the only thing the baseline rules could match"""
+    if pattern.startswith('/'):
+        return [f"https://example.com{pattern}abc123"]
+    if pattern.startswith('.') or pattern.endswith('.m3u8'):
+        return [f"https://example.com/files/lecture{pattern}", f"https://example.com/files/lecture{pattern}?x=1"]
+    label = pattern.split('.')[0]
+    return [
+        f"https://apps.{label}.in/play/123",
+        f"https://x.{pattern}/play/123",
+        f"https://example.com/{pattern}/123",
+        f"https://example.com/play?src={pattern}",
+    ]
+
+def test_classify_never_drops_or_retypes_a_baseline_match():
+    for pattern in BASELINE_VIDEO_PATTERNS + BASELINE_PDF_PATTERNS:
+        for url in baseline_shapes(pattern):
+            expected = baseline_detect_media_type(url)
+            if expected is not None:
+                assert classify(url)[0] == expected, url
+
+def test_classify_matches_platform_label_on_any_domain():
+    assert classify('https://apps.selectionway.in/play/123') == ('video', True)
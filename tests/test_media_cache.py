@@ -0,0 +1,84 @@
+import os
+import json
+from media_cache import MediaCache, INDEX_FILE
+
+def download(tmp_path, name, size):
+    """A finished download outside the cache directory"""
+    path = tmp_path / 'downloads' / name
+    path.parent.mkdir(exist_ok=True)
+    path.write_bytes(b'x' * size)
+    return str(path)
+
+def test_put_moves_file_into_cache_and_get_hits(tmp_path):
+    cache = MediaCache(str(tmp_path / 'cache'), 1000)
+    source = download(tmp_path, 'a.pdf', 100)
+    path = cache.put('https://example.com/a.pdf?utm_source=tg', source)
+    assert not os.path.exists(source)
+    assert os.path.dirname(path) == cache.directory
+    entry = cache.get('https://example.com/a.pdf')
+    assert entry is not None and cache.path(entry) == path
+
+def test_eviction_skips_pinned_files(tmp_path):
+    cache = MediaCache(str(tmp_path / 'cache'), 250)
+    first = cache.put('https://example.com/1.pdf', download(tmp_path, '1.pdf', 100))
+    second = cache.put('https://example.com/2.pdf', download(tmp_path, '2.pdf', 100))
+    # Both still pinned by their uploads: over budget, but nothing may be deleted
+    third = cache.put('https://example.com/3.pdf', download(tmp_path, '3.pdf', 100))
+    assert all(os.path.exists(path) for path in (first, second, third))
+    assert cache.total_bytes == 300
+
+    # Once the oldest is released it is the one evicted
+    cache.release(first)
+    assert not os.path.exists(first)
+    assert os.path.exists(second) and os.path.exists(third)
+    assert cache.total_bytes == 200
+    assert cache.get('https://example.com/1.pdf') is None
+
+def test_pins_are_counted(tmp_path):
+    cache = MediaCache(str(tmp_path / 'cache'), 150)
+    path = cache.put('https://example.com/1.pdf', download(tmp_path, '1.pdf', 100))
+    cache.get('https://example.com/1.pdf')
+    cache.put('https://example.com/2.pdf', download(tmp_path, '2.pdf', 100))
+    cache.release(path)
+    # Still pinned by the get()
+    assert os.path.exists(path)
+    cache.release(path)
+    assert not os.path.exists(path)
+
+def test_release_keeps_cached_and_deletes_uncached_files(tmp_path):
+    cache = MediaCache(str(tmp_path / 'cache'), 1000)
+    cached = cache.put('https://example.com/a.pdf', download(tmp_path, 'a.pdf', 100))
+    uncached = download(tmp_path, 'b.mp4', 100)
+    cache.release(cached)
+    cache.release(uncached)
+    assert os.path.exists(cached)
+    assert not os.path.exists(uncached)
+
+def test_oversized_and_disabled_cache_leave_file_uncached(tmp_path):
+    small = MediaCache(str(tmp_path / 'small'), 50)
+    source = download(tmp_path, 'big.pdf', 100)
+    assert small.put('https://example.com/big.pdf', source) == source
+    small.release(source)
+    assert not os.path.exists(source)
+
+    disabled = MediaCache(str(tmp_path / 'off'), 0)
+    source = download(tmp_path, 'a.pdf', 10)
+    assert disabled.put('https://example.com/a.pdf', source) == source
+    assert disabled.get('https://example.com/a.pdf') is None
+
+def test_load_drops_crash_leftovers_and_mismatched_entries(tmp_path):
+    directory = tmp_path / 'cache'
+    cache = MediaCache(str(directory), 1000)
+    kept = cache.put('https://example.com/a.pdf', download(tmp_path, 'a.pdf', 100))
+    truncated = cache.put('https://example.com/b.pdf', download(tmp_path, 'b.pdf', 100))
+    with open(truncated, 'wb') as f:
+        f.write(b'short')
+    (directory / 'partial.tmp').write_bytes(b'leftover')
+
+    reloaded = MediaCache(str(directory), 1000)
+    assert reloaded.get('https://example.com/a.pdf') is not None
+    assert reloaded.get('https://example.com/b.pdf') is None
+    assert sorted(os.listdir(directory)) == sorted([INDEX_FILE, os.path.basename(kept)])
+    assert reloaded.total_bytes == 100
+    with open(directory / INDEX_FILE) as f:
+        assert len(json.load(f)) == 1
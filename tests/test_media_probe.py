@@ -0,0 +1,33 @@
+import time
+import asyncio
+import media_probe
+from link_parser import make_link
+
+def test_probe_pass_stops_at_deadline_and_keeps_guesses(monkeypatch):
+    async def probe(session, url):
+        if 'slow' in url:
+            await asyncio.sleep(10)
+        return 'pdf'
+
+    monkeypatch.setattr(media_probe, 'probe_media_type', probe)
+    monkeypatch.setattr(media_probe, 'PROBE_DEADLINE', 0.2)
+    links = [
+        make_link('https://example.com/fast/1', 'video', 'Fast', confident=False),
+        make_link('https://example.com/slow/2', 'video', 'Slow', confident=False),
+        make_link('https://example.com/a.pdf', 'pdf', 'Sure'),
+    ]
+
+    started = time.monotonic()
+    changed = asyncio.run(media_probe.resolve_ambiguous(links))
+    assert time.monotonic() - started < 2
+    assert changed == 1
+    assert links[0]['type'] == 'pdf' and 'ambiguous' not in links[0]
+    # Unfinished probe: classifier's guess stands
+    assert links[1]['type'] == 'video' and links[1]['ambiguous']
+
+def test_media_type_for_content_types():
+    assert media_probe.media_type_for('application/pdf; charset=binary') == 'pdf'
+    assert media_probe.media_type_for('video/mp4') == 'video'
+    assert media_probe.media_type_for('application/vnd.apple.mpegurl') == 'video'
+    assert media_probe.media_type_for('text/html') is None
+    assert media_probe.media_type_for(None) is None
@@ -0,0 +1,66 @@
+import time
+import asyncio
+from collections import deque
+from uploader import UploadScheduler
+
+def test_flood_wait_pauses_every_chat():
+    scheduler = UploadScheduler()
+    scheduler.flood_wait(5)
+    now = time.monotonic()
+    # Telegram's wait plus the one second of slack, for chats that never sent anything
+    for chat_id in (1, 2, -100):
+        assert 5 < scheduler._delay(chat_id, now) <= 6
+
+def test_flood_pause_blocks_wait_turn_across_chats():
+    scheduler = UploadScheduler(chat_interval=0)
+    scheduler.pause_until = time.monotonic() + 0.2
+
+    async def turn(chat_id):
+        await scheduler.wait_turn(chat_id)
+        return time.monotonic()
+
+    async def main():
+        started = time.monotonic()
+        finished = await asyncio.gather(turn(1), turn(2), turn(-100))
+        return [end - started for end in finished]
+
+    for waited in asyncio.run(main()):
+        assert waited >= 0.2
+
+def test_per_chat_interval_does_not_delay_other_chats():
+    scheduler = UploadScheduler(chat_interval=1.0)
+    now = time.monotonic()
+    scheduler._chat_sends[1] = deque([now])
+    assert scheduler._delay(1, now) > 0.9
+    assert scheduler._delay(2, now) <= 0
+
+def test_status_drops_progress_and_defers_final_edits_while_paused():
+    scheduler = UploadScheduler()
+    sent = []
+
+    async def edit(text):
+        sent.append(text)
+        return text
+
+    async def main():
+        scheduler.pause_until = time.monotonic() + 0.1
+        assert await scheduler.status(lambda: edit('progress')) is None
+        assert await scheduler.status(lambda: edit('done'), defer=True) is None
+        assert sent == []
+        await asyncio.sleep(0.3)
+        assert await scheduler.status(lambda: edit('after')) == 'after'
+
+    asyncio.run(main())
+    assert sent == ['done', 'after']
+
+def test_status_retry_after_pauses_senders():
+    from telegram.error import RetryAfter
+
+    scheduler = UploadScheduler()
+
+    async def edit():
+        raise RetryAfter(3)
+
+    assert asyncio.run(scheduler.status(edit)) is None
+    assert scheduler.is_paused()
+    assert scheduler._delay(42, time.monotonic()) > 3
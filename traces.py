@@ -0,0 +1,160 @@
+import math
+import time
+import logging
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+TRACE_COLLECTION = 'item_traces'
+TRACE_CAPPED_BYTES = 64 * 1024 * 1024  # Keeps roughly the last 100k items
+TRACE_CAPPED_DOCS = 100000
+
+class ItemTrace:
+    """Structured timing record for one batch item"""
+
+    def __init__(self, batch_id, index, url, media_type):
+        self.batch_id = batch_id
+        self.index = index
+        self.url = url
+        self.host = (urlparse(url).hostname or '').lower()
+        self.media_type = media_type
+        self.started_at = time.time()
+        self.finished_at = None
+        self.stages = {}
+        self.bytes_downloaded = 0
+        self.bytes_uploaded = 0
+        self.retries = 0
+        self.conversion = 'none'
+        self.cache = 'miss'
+        self.result = None
+
+    @contextmanager
+    def stage(self, name):
+        """Record wall time of a stage on the trace and in the stage histogram"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            end = time.time()
+            entry = self.stages.setdefault(name, {'start': start, 'end': end, 'seconds': 0.0})
+            entry['end'] = end
+            entry['seconds'] += end - start
+            STAGE_SECONDS.observe(end - start, stage=name, media_type=self.media_type)
+
+    def finish(self, result):
+        self.result = result
+        self.finished_at = time.time()
+
+    def throughput(self):
+        """Download bytes per second, or None when unknown"""
+        seconds = self.stages.get('download', {}).get('seconds', 0)
+        if seconds <= 0 or not self.bytes_downloaded:
+            return None
+        return self.bytes_downloaded / seconds
+
+    def to_document(self):
+        return {
+            'batch_id': self.batch_id,
+            'index': self.index,
+            'url': self.url[:500],
+            'host': self.host,
+            'media_type': self.media_type,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'stages': self.stages,
+            'bytes_downloaded': self.bytes_downloaded,
+            'bytes_uploaded': self.bytes_uploaded,
+            'throughput': self.throughput(),
+            'retries': self.retries,
+            'conversion': self.conversion,
+            'cache': self.cache,
+            'result': self.result,
+        }
+
+def stage_timer(trace, name, media_type):
+    """Time a stage on the trace if there is one, otherwise only in metrics"""
+    if trace is not None:
+        return trace.stage(name)
+    return STAGE_SECONDS.time(stage=name, media_type=media_type)
+
+class TraceStore:
+    """Persist item traces in a capped MongoDB collection"""
+
+    def __init__(self, db=None):
+        self.attach(db)
+
+    def attach(self, db):
+        self.db = db
+        self.collection = db[TRACE_COLLECTION] if db is not None else None
+
+    async def setup(self):
+        if self.db is None:
+            return
+        try:
+            names = await self.db.list_collection_names()
+            if TRACE_COLLECTION not in names:
+                await self.db.create_collection(
+                    TRACE_COLLECTION,
+                    capped=True,
+                    size=TRACE_CAPPED_BYTES,
+                    max=TRACE_CAPPED_DOCS
+                )
+                logger.info(f"Created capped collection {TRACE_COLLECTION}")
+        except Exception as e:
+            logger.error(f"Trace collection setup failed: {e}")
+
+    async def save(self, trace):
+        if self.collection is None:
+            return
+        try:
+            await self.collection.insert_one(trace.to_document())
+        except Exception as e:
+            logger.debug(f"Trace save error: {e}")
+
+    async def recent(self, limit=1000):
+        if self.collection is None:
+            return []
+        # Capped collections keep insertion order, so natural order is time order
+        cursor = self.collection.find({}, {'_id': 0}).sort('$natural', -1).limit(limit)
+        return await cursor.to_list(length=limit)
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+def summarize(traces):
+    """Aggregate traces into per-stage latency and per-host throughput stats"""
+    stage_values = {}
+    host_values = {}
+    results = {}
+
+    for doc in traces:
+        for name, entry in (doc.get('stages') or {}).items():
+            stage_values.setdefault(name, []).append(entry.get('seconds', 0))
+        if doc.get('throughput'):
+            host_values.setdefault(doc.get('host') or 'unknown', []).append(doc['throughput'])
+        result = doc.get('result') or 'unknown'
+        results[result] = results.get(result, 0) + 1
+
+    stages = {
+        name: {'count': len(v), 'p50': percentile(v, 50), 'p95': percentile(v, 95)}
+        for name, v in stage_values.items()
+    }
+    hosts = {
+        host: {'count': len(v), 'p50': percentile(v, 50), 'p95': percentile(v, 95)}
+        for host, v in host_values.items()
+    }
+
+    return {
+        'items': len(traces),
+        'batches': len({doc.get('batch_id') for doc in traces}),
+        'results': results,
+        'stages': stages,
+        'hosts': hosts,
+    }
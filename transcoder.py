@@ -0,0 +1,140 @@
+import os
+import asyncio
+import logging
+from metrics import QUEUE_DEPTH, ACTIVE_TASKS
+from traces import stage_timer
+
+logger = logging.getLogger(__name__)
+
+# Presets from slowest/smallest to fastest; later ones are used as the backlog grows
+PRESETS = ['medium', 'fast', 'veryfast', 'ultrafast']
+
+def available_cores():
+    """CPU cores this process may use, honouring affinity and cgroup quotas"""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+
+    # Containers (Render, Docker --cpus) expose the real limit via cgroups
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            cores = min(cores, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+
+    return max(1, cores)
+
+class TranscodeScheduler:
+    """Limits concurrent ffmpeg encodes to the available cores and adapts the preset to the backlog"""
+
+    def __init__(self, cores=None, slots=None):
+        self.cores = cores or available_cores()
+        # libx264 scales well up to a few threads, so prefer fewer, wider jobs
+        self.slots = slots or max(1, self.cores // 4)
+        self.threads = max(1, self.cores // self.slots)
+        self.waiting = 0
+        self.running = 0
+        self._semaphore = asyncio.Semaphore(self.slots)
+
+    def choose_preset(self):
+        """medium while jobs fit the slots, one step faster per extra slot-full waiting"""
+        # Called just before this job is counted as running, so include it
+        backlog = self.waiting + self.running + 1
+        step = (backlog - 1) // self.slots
+        return PRESETS[min(step, len(PRESETS) - 1)]
+
+    async def transcode(self, input_file, output_file, on_progress=None, trace=None):
+        """Re-encode to H.264/AAC mp4; returns (success, preset)"""
+        self.waiting += 1
+        QUEUE_DEPTH.set(self.waiting, queue='transcode')
+        try:
+            async with self._semaphore:
+                self.waiting -= 1
+                QUEUE_DEPTH.set(self.waiting, queue='transcode')
+                preset = self.choose_preset()
+                self.running += 1
+                ACTIVE_TASKS.inc(kind='transcode')
+                try:
+                    ok = await self._run_ffmpeg(input_file, output_file, preset, on_progress, trace)
+                    return ok, preset
+                finally:
+                    self.running -= 1
+                    ACTIVE_TASKS.dec(kind='transcode')
+        except Exception as e:
+            logger.error(f"Transcode error: {e}", exc_info=True)
+            return False, None
+
+    async def _run_ffmpeg(self, input_file, output_file, preset, on_progress, trace):
+        with stage_timer(trace, 'probe', 'video'):
+            duration = await probe_duration(input_file)
+
+        cmd = [
+            'ffmpeg',
+            '-hide_banner',
+            '-loglevel', 'error',
+            '-nostats',
+            '-progress', 'pipe:1',
+            '-i', input_file,
+            '-c:v', 'libx264',
+            '-preset', preset,
+            '-threads', str(self.threads),
+            '-crf', '23',
+            '-c:a', 'aac',
+            '-b:a', '128k',
+            '-movflags', '+faststart',
+            '-y',
+            output_file
+        ]
+
+        logger.info(f"Transcoding {input_file} (preset {preset}, {self.threads} threads, "
+                    f"{self.running}/{self.slots} slots busy, {self.waiting} waiting)")
+
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+
+        # Drain stderr alongside progress so a chatty ffmpeg cannot block on a full pipe
+        stderr_task = asyncio.create_task(process.stderr.read())
+
+        async for raw in process.stdout:
+            key, _, value = raw.decode(errors='ignore').strip().partition('=')
+            # out_time_us (and the misnamed out_time_ms) are both microseconds
+            if key in ('out_time_us', 'out_time_ms') and on_progress:
+                try:
+                    done = int(value) / 1_000_000
+                except ValueError:
+                    continue
+                await on_progress(done, duration, preset)
+
+        stderr = await stderr_task
+        await process.wait()
+
+        if process.returncode == 0 and os.path.exists(output_file):
+            logger.info(f"Conversion successful: {output_file}")
+            return True
+
+        logger.error(f"Conversion failed: {stderr.decode(errors='ignore')}")
+        return False
+
+async def probe_duration(path):
+    """Media duration in seconds via ffprobe, or None"""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            'ffprobe', '-v', 'error',
+            '-show_entries', 'format=duration',
+            '-of', 'default=noprint_wrappers=1:nokey=1',
+            path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        stdout, _ = await process.communicate()
+        return float(stdout.decode().strip())
+    except Exception:
+        return None
+
+scheduler = TranscodeScheduler(slots=int(os.getenv('TRANSCODE_SLOTS', 0)) or None)
@@ -1,28 +1,131 @@
 import os
 import math
 import logging
+import time
+import random
 import asyncio
-from telegram.error import TelegramError, NetworkError, TimedOut
+from collections import deque
+from contextlib import ExitStack
+from telegram import InputMediaDocument
+from telegram.error import TelegramError, NetworkError, TimedOut, RetryAfter, BadRequest
+from disk_writer import media_exists, media_size, media_name, open_media
+from metrics import BYTES_UPLOADED, RETRIES, FLOOD_WAITS, FLOOD_WAIT_SECONDS
+from traces import stage_timer
 
 logger = logging.getLogger(__name__)
 
 MAX_FILE_SIZE = 2000 * 1024 * 1024  # 2GB Telegram limit
+MAX_GROUP_SIZE = 10  # Telegram album limit
+GROUP_MAX_FILE_SIZE = 50 * 1024 * 1024  # Larger documents are sent on their own
+
+class UploadScheduler:
+    """Paces Bot API sends: shared flood-wait pause plus per-chat and global send windows"""
+    
+    def __init__(self, chat_interval=1.0, group_per_minute=20, global_per_second=30,
+                 backoff_base=2.0, backoff_cap=60.0):
+        self.chat_interval = chat_interval
+        self.group_per_minute = group_per_minute
+        self.global_per_second = global_per_second
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.pause_until = 0.0
+        self._chat_sends = {}
+        self._global_sends = deque()
+        self._deferred = set()
+    
+    def is_paused(self):
+        return time.monotonic() < self.pause_until
+    
+    def flood_wait(self, retry_after):
+        """Pause all senders; returns the wait in seconds"""
+        seconds = retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
+        # Telegram counts from when it answered, so add a little slack
+        seconds += 1
+        self.pause_until = max(self.pause_until, time.monotonic() + seconds)
+        FLOOD_WAITS.inc()
+        FLOOD_WAIT_SECONDS.inc(seconds)
+        return seconds
+    
+    async def status(self, call, defer=False):
+        """Send or edit a status message outside flood pauses; call returns the request coroutine
+
+        While paused, progress edits are dropped and deferred ones (final states)
+        are sent in the background once the pause ends. Returns None when not sent.
+        """
+        if self.is_paused():
+            if defer:
+                task = asyncio.create_task(self._status_later(call))
+                self._deferred.add(task)
+                task.add_done_callback(self._deferred.discard)
+            return None
+        try:
+            return await call()
+        except RetryAfter as e:
+            self.flood_wait(e.retry_after)
+            return None
+    
+    async def _status_later(self, call):
+        while self.is_paused():
+            await asyncio.sleep(self.pause_until - time.monotonic())
+        try:
+            await self.status(call, defer=True)
+        except Exception as e:
+            logger.debug(f"Deferred status error: {e}")
+    
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff for transient errors"""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+    
+    async def wait_turn(self, chat_id):
+        """Sleep until a send to chat_id fits every limit, then record it"""
+        while True:
+            now = time.monotonic()
+            delay = self._delay(chat_id, now)
+            if delay <= 0:
+                self._chat_sends.setdefault(chat_id, deque()).append(now)
+                self._global_sends.append(now)
+                return
+            await asyncio.sleep(delay)
+    
+    def _delay(self, chat_id, now):
+        sends = self._chat_sends.get(chat_id, deque())
+        while sends and now - sends[0] >= 60:
+            sends.popleft()
+        while self._global_sends and now - self._global_sends[0] >= 1:
+            self._global_sends.popleft()
+        
+        delay = self.pause_until - now
+        if sends:
+            delay = max(delay, sends[-1] + self.chat_interval - now)
+        # Groups and channels (negative ids) have a stricter per-minute limit
+        if chat_id < 0 and len(sends) >= self.group_per_minute:
+            delay = max(delay, sends[-self.group_per_minute] + 60 - now)
+        if len(self._global_sends) >= self.global_per_second:
+            delay = max(delay, self._global_sends[-self.global_per_second] + 1 - now)
+        return delay
+
+scheduler = UploadScheduler()
 
 class UploadProgress:
-    def __init__(self, index, total, chat_id, bot):
+    def __init__(self, index, total, chat_id, bot, status_msg=None):
         self.index = index
         self.total = total
         self.chat_id = chat_id
         self.bot = bot
-        self.status_msg = None
+        # An existing message (e.g. a PDF group's download status) is edited instead of sending a new one
+        self.status_msg = status_msg
     
     async def create_status(self):
+        text = f"📤 **Uploading [{self.index}/{self.total}]...**"
         try:
-            self.status_msg = await self.bot.send_message(
+            if self.status_msg:
+                await scheduler.status(lambda: self.status_msg.edit_text(text, parse_mode='Markdown'))
+                return
+            self.status_msg = await scheduler.status(lambda: self.bot.send_message(
                 self.chat_id,
-                f"📤 **Uploading [{self.index}/{self.total}]...**",
+                text,
                 parse_mode='Markdown'
-            )
+            ))
         except:
             pass
     
@@ -44,7 +147,7 @@ class UploadProgress:
                 f"💾 {self._format_size(current)} / {self._format_size(total)}"
             )
             
-            await self.status_msg.edit_text(text, parse_mode='Markdown')
+            await scheduler.status(lambda: self.status_msg.edit_text(text, parse_mode='Markdown'))
         except Exception as e:
             logger.debug(f"Upload status update error: {e}")
     
@@ -56,7 +159,7 @@ class UploadProgress:
                     text = f"✅ **Uploaded [{self.index}/{self.total}]{part_text}**"
                 else:
                     text = f"❌ **Upload Failed [{self.index}/{self.total}]{part_text}**"
-                await self.status_msg.edit_text(text, parse_mode='Markdown')
+                await scheduler.status(lambda: self.status_msg.edit_text(text, parse_mode='Markdown'), defer=True)
         except:
             pass
     
@@ -67,52 +170,57 @@ class UploadProgress:
             bytes_val /= 1024.0
         return f"{bytes_val:.2f} PB"
 
-async def upload_media(file_path, media_type, caption, index, total, chat_id, bot, user_id):
+async def upload_media(file_path, media_type, caption, index, total, chat_id, bot, user_id, trace=None, status_msg=None):
     """Main upload function with file splitting for large files"""
     
-    if not os.path.exists(file_path):
+    if not media_exists(file_path):
         logger.error(f"File not found: {file_path}")
         return False
     
-    file_size = os.path.getsize(file_path)
+    file_size = media_size(file_path)
     logger.info(f"Uploading {file_path} ({_format_bytes(file_size)})")
     
-    progress = UploadProgress(index, total, chat_id, bot)
+    progress = UploadProgress(index, total, chat_id, bot, status_msg)
     await progress.create_status()
     
     try:
         if file_size > MAX_FILE_SIZE:
             # Split and upload
             logger.info(f"File too large ({_format_bytes(file_size)}), splitting...")
-            return await upload_large_file(file_path, media_type, caption, progress, chat_id, bot)
+            return await upload_large_file(file_path, media_type, caption, progress, chat_id, bot, trace)
         else:
             # Direct upload
-            return await upload_single_file(file_path, media_type, caption, progress, chat_id, bot)
+            return await upload_single_file(file_path, media_type, caption, progress, chat_id, bot, trace=trace)
             
     except Exception as e:
         logger.error(f"Upload error: {e}", exc_info=True)
         await progress.complete(success=False)
         return False
 
-async def upload_single_file(file_path, media_type, caption, progress, chat_id, bot, part_num=None):
-    """Upload a single file"""
+async def upload_single_file(file_path, media_type, caption, progress, chat_id, bot, part_num=None, trace=None):
+    """Upload a single file, pacing sends through the shared scheduler"""
     
-    max_retries = 3
-    retry_delay = 5
+    max_retries = 5
+    max_flood_waits = 5
+    attempt = 0
+    flood_waits = 0
     
-    for attempt in range(max_retries):
+    while True:
+        await scheduler.wait_turn(chat_id)
+        
         try:
-            file_size = os.path.getsize(file_path)
+            file_size = media_size(file_path)
             
             # Limit caption to 1024 characters
             final_caption = caption[:1024] if caption else None
             
-            with open(file_path, 'rb') as f:
+            with open_media(file_path) as f, stage_timer(trace, 'upload', media_type):
                 if media_type == 'video':
                     # Upload as video
-                    await bot.send_video(
+                    message = await bot.send_video(
                         chat_id=chat_id,
                         video=f,
+                        filename=media_name(file_path),
                         caption=final_caption,
                         supports_streaming=True,
                         read_timeout=600,
@@ -122,9 +230,10 @@ async def upload_single_file(file_path, media_type, caption, progress, chat_id,
                     )
                 else:
                     # Upload as document (PDF)
-                    await bot.send_document(
+                    message = await bot.send_document(
                         chat_id=chat_id,
                         document=f,
+                        filename=media_name(file_path),
                         caption=final_caption,
                         read_timeout=600,
                         write_timeout=600,
@@ -132,19 +241,34 @@ async def upload_single_file(file_path, media_type, caption, progress, chat_id,
                         pool_timeout=120
                     )
             
+            BYTES_UPLOADED.inc(file_size, media_type=media_type)
+            if trace:
+                trace.bytes_uploaded += file_size
             await progress.complete(success=True, part=part_num)
             logger.info(f"Upload successful: {file_path}")
-            return True
+            # The sent message carries the file_id used to re-send duplicates
+            return message
+            
+        except RetryAfter as e:
+            # Flood control applies to the whole bot, so every sender waits
+            flood_waits += 1
+            seconds = scheduler.flood_wait(e.retry_after)
+            logger.warning(f"Flood control ({flood_waits}/{max_flood_waits}): pausing uploads for {seconds:.0f}s")
+            if flood_waits >= max_flood_waits:
+                logger.error(f"Upload failed after {flood_waits} flood waits")
+                await progress.complete(success=False, part=part_num)
+                return False
+            _count_retry(trace)
             
         except (NetworkError, TimedOut) as e:
-            logger.warning(f"Network error on attempt {attempt + 1}/{max_retries}: {e}")
-            if attempt < max_retries - 1:
-                await asyncio.sleep(retry_delay)
-                continue
-            else:
+            attempt += 1
+            logger.warning(f"Network error on attempt {attempt}/{max_retries}: {e}")
+            if attempt >= max_retries:
                 logger.error(f"Upload failed after {max_retries} attempts")
                 await progress.complete(success=False, part=part_num)
                 return False
+            _count_retry(trace)
+            await asyncio.sleep(scheduler.backoff(attempt))
                 
         except TelegramError as e:
             logger.error(f"Telegram error: {e}")
@@ -155,10 +279,13 @@ async def upload_single_file(file_path, media_type, caption, progress, chat_id,
             logger.error(f"Unexpected error: {e}", exc_info=True)
             await progress.complete(success=False, part=part_num)
             return False
-    
-    return False
 
-async def upload_large_file(file_path, media_type, caption, progress, chat_id, bot):
+def _count_retry(trace):
+    RETRIES.inc(operation='upload')
+    if trace:
+        trace.retries += 1
+
+async def upload_large_file(file_path, media_type, caption, progress, chat_id, bot, trace=None):
     """Split and upload large files"""
     
     try:
@@ -167,7 +294,8 @@ async def upload_large_file(file_path, media_type, caption, progress, chat_id, b
         
         logger.info(f"Splitting into {num_parts} parts...")
         
-        part_files = split_file(file_path, num_parts)
+        with stage_timer(trace, 'split', media_type):
+            part_files = await asyncio.get_event_loop().run_in_executor(None, split_file, file_path, num_parts)
         
         if not part_files:
             logger.error("File splitting failed")
@@ -185,7 +313,7 @@ async def upload_large_file(file_path, media_type, caption, progress, chat_id, b
                 part_progress = UploadProgress(progress.index, progress.total, chat_id, bot)
                 await part_progress.create_status()
                 
-                if await upload_single_file(part_file, media_type, part_caption, part_progress, chat_id, bot, part_num=i):
+                if await upload_single_file(part_file, media_type, part_caption, part_progress, chat_id, bot, part_num=i, trace=trace):
                     success_count += 1
                 
                 # Cleanup part file
@@ -205,6 +333,143 @@ async def upload_large_file(file_path, media_type, caption, progress, chat_id, b
         await progress.complete(success=False)
         return False
 
+async def upload_document_group(items, total, chat_id, bot, status_msg=None):
+    """Send consecutive documents as one album, falling back to single uploads"""
+    
+    if len(items) == 1:
+        item = items[0]
+        return [await upload_media(item['file_path'], 'pdf', item['caption'], item['index'],
+                                   total, chat_id, bot, None, trace=item['trace'], status_msg=status_msg)]
+    
+    span = f"{items[0]['index']}-{items[-1]['index']}"
+    logger.info(f"Uploading {len(items)} documents as one group [{span}/{total}]")
+    
+    progress = UploadProgress(span, total, chat_id, bot, status_msg)
+    await progress.create_status()
+    
+    messages = await send_document_group(items, chat_id, bot)
+    if messages:
+        await progress.complete(success=True)
+        return list(messages)
+    
+    logger.warning(f"Document group [{span}/{total}] failed, sending items one by one")
+    try:
+        if progress.status_msg:
+            await progress.status_msg.delete()
+    except:
+        pass
+    
+    results = []
+    for item in items:
+        results.append(await upload_media(item['file_path'], 'pdf', item['caption'], item['index'],
+                                          total, chat_id, bot, None, trace=item['trace']))
+    return results
+
+async def send_document_group(items, chat_id, bot):
+    """Single send_media_group call with flood-wait and network retries; returns the sent messages"""
+    
+    max_retries = 3
+    max_flood_waits = 5
+    attempt = 0
+    flood_waits = 0
+    
+    while True:
+        await scheduler.wait_turn(chat_id)
+        
+        try:
+            with ExitStack() as stack:
+                media = []
+                for item in items:
+                    f = stack.enter_context(open_media(item['file_path']))
+                    caption = item['caption'][:1024] if item['caption'] else None
+                    media.append(InputMediaDocument(media=f, caption=caption,
+                                                    filename=media_name(item['file_path'])))
+                    if item['trace']:
+                        stack.enter_context(item['trace'].stage('upload'))
+                
+                messages = await bot.send_media_group(
+                    chat_id=chat_id,
+                    media=media,
+                    read_timeout=600,
+                    write_timeout=600,
+                    connect_timeout=120,
+                    pool_timeout=120
+                )
+            
+            for item in items:
+                size = media_size(item['file_path'])
+                BYTES_UPLOADED.inc(size, media_type='pdf')
+                if item['trace']:
+                    item['trace'].bytes_uploaded += size
+            return messages
+            
+        except RetryAfter as e:
+            flood_waits += 1
+            seconds = scheduler.flood_wait(e.retry_after)
+            logger.warning(f"Flood control ({flood_waits}/{max_flood_waits}): pausing uploads for {seconds:.0f}s")
+            if flood_waits >= max_flood_waits:
+                return False
+            RETRIES.inc(operation='upload_group')
+            
+        except (NetworkError, TimedOut) as e:
+            attempt += 1
+            logger.warning(f"Network error on group attempt {attempt}/{max_retries}: {e}")
+            if attempt >= max_retries:
+                return False
+            RETRIES.inc(operation='upload_group')
+            await asyncio.sleep(scheduler.backoff(attempt))
+            
+        except Exception as e:
+            logger.error(f"Document group error: {e}")
+            return False
+
+async def resend_file(file_id, media_type, caption, chat_id, bot, trace=None):
+    """Send an already uploaded file again by its file_id
+
+    Returns the sent message, or None after transient failures. Raises
+    BadRequest when Telegram no longer accepts the file_id.
+    """
+    
+    max_attempts = 3
+    max_flood_waits = 5
+    attempt = 0
+    flood_waits = 0
+    
+    while True:
+        await scheduler.wait_turn(chat_id)
+        
+        try:
+            final_caption = caption[:1024] if caption else None
+            with stage_timer(trace, 'upload', media_type):
+                if media_type == 'video':
+                    return await bot.send_video(chat_id=chat_id, video=file_id, caption=final_caption,
+                                                supports_streaming=True)
+                return await bot.send_document(chat_id=chat_id, document=file_id, caption=final_caption)
+            
+        except BadRequest:
+            # The file_id itself was refused (BadRequest subclasses NetworkError, so it goes first)
+            raise
+            
+        except RetryAfter as e:
+            flood_waits += 1
+            seconds = scheduler.flood_wait(e.retry_after)
+            logger.warning(f"Flood control on re-send ({flood_waits}/{max_flood_waits}): pausing uploads for {seconds:.0f}s")
+            if flood_waits >= max_flood_waits:
+                return None
+            
+        except (NetworkError, TimedOut) as e:
+            attempt += 1
+            logger.warning(f"Network error on re-send attempt {attempt}/{max_attempts}: {e}")
+            if attempt >= max_attempts:
+                return None
+            await asyncio.sleep(scheduler.backoff(attempt))
+            
+        except TelegramError as e:
+            logger.error(f"Re-send by file_id failed: {e}")
+            return None
+        
+        _count_retry(trace)
+
 def split_file(file_path, num_parts):
     """Split file into multiple parts"""
     
@@ -0,0 +1,131 @@
+import time
+import uuid
+import queue
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+# Seconds between progress messages a worker sends for one job
+PROGRESS_INTERVAL = 1.0
+
+# Worker process state; each worker keeps one warm YoutubeDL instance
+_ydl = None
+_progress_queue = None
+_current_job = None
+_last_report = 0.0
+
+def _init_worker(base_opts, progress_queue):
+    global _ydl, _progress_queue
+    import yt_dlp
+
+    _progress_queue = progress_queue
+    opts = dict(base_opts)
+    opts['progress_hooks'] = [_progress_hook]
+    _ydl = yt_dlp.YoutubeDL(opts)
+
+def _progress_hook(d):
+    global _last_report
+    if d.get('status') != 'downloading' or _current_job is None:
+        return
+    now = time.monotonic()
+    if now - _last_report < PROGRESS_INTERVAL:
+        return
+    _last_report = now
+    downloaded = d.get('downloaded_bytes', 0) or 0
+    total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+    _progress_queue.put((_current_job, downloaded, total))
+
+def _noop():
+    return None
+
+def _run_job(job_id, url, outtmpl):
+    global _current_job, _last_report
+    _current_job = job_id
+    _last_report = 0.0
+    _ydl.params['outtmpl']['default'] = outtmpl
+    _ydl.params['http_headers']['Referer'] = url
+    try:
+        _ydl.download([url])
+    except Exception as e:
+        # yt-dlp exceptions may not survive pickling back to the parent
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+    finally:
+        _current_job = None
+
+class YtdlPool:
+    """Long-lived yt-dlp worker processes, recycled after max_jobs downloads each"""
+
+    def __init__(self, base_opts, workers=2, max_jobs=20):
+        self.base_opts = base_opts
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self._executor = None
+        self._progress_queue = None
+        self._callbacks = {}
+        self._loop = None
+        self._drain_thread = None
+
+    def _ensure_started(self):
+        if self._executor is not None:
+            return
+        # spawn keeps the bot's event loop and sockets out of the workers
+        ctx = multiprocessing.get_context('spawn')
+        if self._progress_queue is None:
+            self._progress_queue = ctx.Queue()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(self.base_opts, self._progress_queue),
+            max_tasks_per_child=self.max_jobs
+        )
+        if self._drain_thread is None:
+            self._drain_thread = threading.Thread(target=self._drain, name='ytdl-progress', daemon=True)
+            self._drain_thread.start()
+        logger.info(f"yt-dlp pool started: {self.workers} workers, recycled every {self.max_jobs} jobs")
+
+    def _drain(self):
+        while True:
+            try:
+                job_id, downloaded, total = self._progress_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            callback = self._callbacks.get(job_id)
+            if callback and self._loop:
+                self._loop.call_soon_threadsafe(callback, downloaded, total)
+
+    def warm(self):
+        """Spawn the workers now so the first video does not wait for them"""
+        self._ensure_started()
+        for _ in range(self.workers):
+            self._executor.submit(_noop)
+
+    async def download(self, url, outtmpl, on_progress=None):
+        """Run one download in a worker; on_progress(downloaded, total) runs on the loop"""
+        self._loop = asyncio.get_running_loop()
+        self._ensure_started()
+        job_id = uuid.uuid4().hex
+        if on_progress:
+            self._callbacks[job_id] = on_progress
+        try:
+            await self._loop.run_in_executor(self._executor, _run_job, job_id, url, outtmpl)
+        except BrokenProcessPool:
+            # A worker died (OOM, segfault in a native lib); start fresh next time
+            logger.error("yt-dlp worker pool broke, restarting on next job")
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            raise
+        finally:
+            self._callbacks.pop(job_id, None)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None